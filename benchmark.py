@@ -0,0 +1,471 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import logging
+import statistics
+import tempfile
+
+# Garantir que o diretório atual esteja no PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+import numpy as np
+import pandas as pd
+import plotly.io
+
+from utils import (
+    create_sample_data, sample_sheet, write_sample_fixture, prepare_dataframe, build_cube, update_cube,
+    build_filter_index, filter_positions, filter_dataframe, build_view_model, build_filter_options, ranking_window
+)
+from exports import export_bytes
+from data_loader import (
+    Dataset, clean_data, normalize_data, apply_delta, parse_csv, _read_worksheet, reset_gspread_pool, load_periods,
+    get_view, invalidate_views, get_export, invalidate_exports, get_figure, invalidate_figures
+)
+from metrics import (
+    display_metric_cards, display_top_performers, display_priority_attention, display_category_breakdown
+)
+from visualizations import CachedFigure, create_efficiency_map, create_ranking_chart, create_category_distribution
+from details import display_data_table
+from sidebar import create_sidebar
+import sections
+from engines import available_engines, get_engine
+from test_engines import check_engine_parity
+from test_memory import DEFAULT_MEMORY_LIMIT, measure_rerun_memory, check_memory
+
+# Fora do `streamlit run` os comandos st.* não desenham nada; silenciar o aviso repetido
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+# Tamanhos (número de escolas) medidos por padrão
+DEFAULT_SIZES = [150, 10_000, 1_000_000]
+
+# Visões do dashboard
+DISPLAY_OPTIONS = ["Escolas", "Cidades", "GREs"]
+
+# Acima deste tamanho cada etapa é medida uma única vez
+LARGE_SIZE = 100_000
+
+# Piora (razão entre medianas) a partir da qual a comparação acusa regressão
+DEFAULT_REGRESSION_LIMIT = 1.2
+
+# Elementos (mensagens enviadas ao navegador) aceitos por execução na área principal
+DEFAULT_ELEMENT_LIMIT = 40
+
+# Atrasos (segundos) simulados no download de cada aba em load_periods
+PERIOD_DELAYS = [0.2, 0.4, 0.6, 0.8, 1.0]
+
+# Script do dashboard executado na contagem de elementos
+APP_PATH = os.path.join(current_dir, "app.py")
+
+def make_fixture(n_escolas, seed):
+    """
+    Gera os dados de exemplo e a planilha equivalente (valores e CSV exportado)
+    """
+    df = create_sample_data(n_escolas, n_cidades=min(185, max(16, n_escolas // 5)), seed=seed)
+    sheet = sample_sheet(df)
+    values = [list(sheet.columns)] + sheet.astype(object).to_numpy().tolist()
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(write_sample_fixture(os.path.join(tmp, "planilha.csv"), df=df), "rb") as f:
+            raw = f.read()
+    return df, values, raw
+
+class _StubWorksheet:
+    """
+    Aba falsa que devolve valores já em memória (sem rede)
+    """
+    def __init__(self, values):
+        self.values = values
+
+    def get_all_values(self, value_render_option=None):
+        return self.values
+
+class _StubSheetsClient:
+    """
+    Cliente falso da API do Google Sheets, usado para medir o caminho gspread
+    """
+    def __init__(self, values):
+        self.values = values
+
+    def open_by_key(self, key):
+        return self
+
+    def worksheet(self, name):
+        return _StubWorksheet(self.values)
+
+def time_stage(func, repeticoes):
+    """
+    Executa `func` várias vezes e retorna o menor tempo e a mediana (segundos)
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        tempos.append(time.perf_counter() - inicio)
+    return {"min_s": min(tempos), "mediana_s": statistics.median(tempos), "repeticoes": repeticoes}
+
+def benchmark_size(n_escolas, repeticoes, seed, motores=("pandas",)):
+    """
+    Mede cada etapa de uma execução completa do dashboard para um tamanho de dados
+    """
+    df, values, raw = make_fixture(n_escolas, seed)
+    if n_escolas >= LARGE_SIZE:
+        repeticoes = 1
+
+    stages = {}
+
+    # Carga: leitura do CSV exportado e limpeza
+    stages["load_data.clean"] = lambda: clean_data(parse_csv(raw))
+
+    # Carga alternativa: gspread contra um stub local da API
+    def _gspread_stub():
+        reset_gspread_pool()
+        clean_data(_read_worksheet("stub", authorize=lambda: _StubSheetsClient(values)))
+    stages["load_data.gspread_stub"] = _gspread_stub
+
+    # Atualização com uma escola alterada: limpeza completa x aplicação incremental
+    bruto = parse_csv(raw)
+    atual = clean_data(bruto)
+    alterado = bruto.assign(INSCRITOS=bruto['INSCRITOS'].where(bruto.index != 0, "0"))
+    stages["ingestao.completa"] = lambda: clean_data(alterado)
+    stages["ingestao.incremental"] = lambda: apply_delta(atual, normalize_data(alterado))
+
+    # Cubo da nova versão: reconstruído x atualizado só no par (GRE, CIDADE) da escola alterada
+    novo, alteracoes = apply_delta(atual, normalize_data(alterado))
+    cubo_atual = build_cube(atual)
+    stages["ingestao.cubo.completo"] = lambda: build_cube(novo)
+    stages["ingestao.cubo.incremental"] = lambda: update_cube(cubo_atual, novo, alteracoes.cidades)
+
+    # Estruturas calculadas uma vez por versão dos dados
+    stages["dataset.build_cube"] = lambda: build_cube(df)
+    cube = build_cube(df)
+    stages["dataset.filter_index"] = lambda: build_filter_index(df)
+    index = build_filter_index(df)
+    gre, cidade = next(iter(index['CIDADE']))
+    stages["dataset.filter_options"] = lambda: build_filter_options(index)
+    options = build_filter_options(index)
+
+    # Opções da barra lateral para uma GRE: listas tiradas do dataframe a cada interação x metadados da versão
+    def _opcoes_dataframe():
+        sorted(df['GRE'].unique().tolist())
+        sorted(df[df['GRE'] == gre]['CIDADE'].unique().tolist())
+    stages["sidebar.opcoes.dataframe"] = _opcoes_dataframe
+    stages["sidebar.opcoes.metadados"] = lambda: options.cities_for(gre)
+
+    # Filtro de uma GRE e uma cidade: varredura com máscaras x leitura posicional pelo índice.
+    # A busca das posições não depende do número de escolas; a leitura cresce só com o resultado.
+    stages["filtro.mascara"] = lambda: df[(df['GRE'] == gre) & (df['CIDADE'] == cidade)]
+    stages["filtro.posicoes"] = lambda: filter_positions(index, gre, cidade)
+    stages["filtro.indice"] = lambda: filter_dataframe(df, index, gre, cidade)
+
+    # Seleção múltipla (três GREs): uma máscara por valor x união das posições de cada GRE
+    varias_gres = sorted(index['GRE'])[:3]
+    stages["filtro.multi.mascara"] = lambda: df[df['GRE'].isin(varias_gres)]
+    stages["filtro.multi.posicoes"] = lambda: filter_positions(index, varias_gres)
+    stages["filtro.multi.indice"] = lambda: filter_dataframe(df, index, varias_gres)
+
+    # Visão já preparada por outra sessão (cache de visões entre sessões)
+    dataset = Dataset(
+        df=df, versao=f"benchmark-{n_escolas}", atualizado_em=time.time(),
+        estruturas={"cube": cube, "filter_index": index, "filter_options": options}
+    )
+    get_view(dataset, gre, "Todas", "Cidades")
+    stages["visao.cache_hit"] = lambda: get_view(dataset, gre, "Todas", "Cidades")
+
+    # Exportação (gerada só no clique): CSV de uma GRE, Parquet de todos os dados e arquivo já em cache
+    stages["exportacao.csv.gre"] = lambda: export_bytes(filter_dataframe(df, index, gre), "CSV")
+    stages["exportacao.parquet"] = lambda: export_bytes(df, "Parquet")
+    get_export(dataset, "Parquet")
+    stages["exportacao.cache_hit"] = lambda: get_export(dataset, "Parquet")
+
+    # Filtros e agrupamentos em cada motor (o pandas usa o cubo e o índice)
+    for nome in motores:
+        engine = get_engine(nome)
+        extras = {"cube": cube, "index": index} if nome == "pandas" else {}
+        for display_option in DISPLAY_OPTIONS:
+            prefixo = f"motor.{nome}.{display_option.lower()}"
+            stages[prefixo] = (
+                lambda e=engine, d=display_option, x=extras: e.prepare(df, "Todas", "Todas", d, **x)
+            )
+            stages[f"{prefixo}.gre"] = (
+                lambda e=engine, d=display_option, x=extras: e.prepare(df, gre, "Todas", d, **x)
+            )
+        stages[f"motor.{nome}.gre_summary"] = lambda e=engine: e.gre_summary(df)
+
+    for display_option in DISPLAY_OPTIONS:
+        filtered_df, grouped_df, column_name = prepare_dataframe(
+            df, "Todas", "Todas", display_option, cube=cube, index=index
+        )
+        view = build_view_model(filtered_df, grouped_df, column_name, display_option)
+        prefixo = display_option.lower()
+
+        stages[f"{prefixo}.prepare_dataframe"] = (
+            lambda d=display_option: prepare_dataframe(df, "Todas", "Todas", d, cube=cube, index=index)
+        )
+        stages[f"{prefixo}.build_view_model"] = (
+            lambda f=filtered_df, g=grouped_df, c=column_name, d=display_option: build_view_model(f, g, c, d)
+        )
+        stages[f"{prefixo}.display_metric_cards"] = lambda v=view: display_metric_cards(v)
+        stages[f"{prefixo}.display_top_performers"] = lambda v=view: display_top_performers(v)
+        stages[f"{prefixo}.display_priority_attention"] = lambda v=view: display_priority_attention(v)
+        stages[f"{prefixo}.display_category_breakdown"] = lambda v=view: display_category_breakdown(v)
+        stages[f"{prefixo}.create_efficiency_map"] = (
+            lambda v=view: create_efficiency_map(v.grouped_df, v.column_name)
+        )
+        stages[f"{prefixo}.create_ranking_chart"] = (
+            lambda v=view: create_ranking_chart(v.grouped_df, v.column_name, v.display_option)
+        )
+        stages[f"{prefixo}.create_category_distribution"] = lambda v=view: create_category_distribution(v)
+
+        # Ranking paginado: só a página visível vai para o gráfico
+        stages[f"{prefixo}.ranking.pagina"] = lambda v=view: create_ranking_chart(
+            v.grouped_df.iloc[slice(*ranking_window(len(v.grouped_df)))], v.column_name, v.display_option
+        )
+
+        # Mapa de eficiência até o JSON enviado ao navegador: construído e serializado a cada
+        # execução x servido do cache de figuras
+        stages[f"{prefixo}.figura.construida"] = (
+            lambda v=view: plotly.io.to_json(create_efficiency_map(v.grouped_df, v.column_name), validate=False)
+        )
+        construir = lambda v=view: create_efficiency_map(v.grouped_df, v.column_name)
+        get_figure(dataset, "mapa", construir, display_option=display_option)
+        stages[f"{prefixo}.figura.cache_hit"] = (
+            lambda d=display_option, c=construir: plotly.io.to_json(
+                CachedFigure(get_figure(dataset, "mapa", c, display_option=d)), validate=False
+            )
+        )
+
+    resultados = []
+    for etapa, func in stages.items():
+        resultado = time_stage(func, repeticoes)
+        resultado.update({"tamanho": n_escolas, "etapa": etapa})
+        resultados.append(resultado)
+        print(f"{n_escolas:>10,} {etapa:<45} {resultado['mediana_s'] * 1000:>10.1f} ms")
+
+    invalidate_views()
+    invalidate_exports()
+    invalidate_figures()
+    return resultados
+
+def measure_interactions(n_escolas, seed, repeticoes):
+    """
+    Latência de cada seção do dashboard e de uma execução completa (barra lateral,
+    visão, métricas, listas e todas as seções), com os caches de visões e figuras
+    já preenchidos. Sem fragmentos, qualquer interação reexecuta a página inteira;
+    com eles, uma interação dentro do ranking (o único fragmento) reexecuta só o ranking.
+    """
+    df, _, _ = make_fixture(n_escolas, seed)
+    dataset = Dataset(df=df, versao=f"interacoes-{n_escolas}", atualizado_em=time.time())
+
+    # Fora do `streamlit run` os fragmentos não executam: medir a função original do ranking
+    secoes = {
+        "mapa": sections.efficiency_map_section,
+        "ranking": sections.ranking_section.__wrapped__,
+        "categorias": sections.category_section
+    }
+
+    def _pagina(display_option):
+        view = get_view(dataset, "Todas", "Todas", display_option)
+        display_metric_cards(view)
+        display_top_performers(view)
+        display_priority_attention(view)
+        for secao in secoes.values():
+            secao(dataset, view)
+        sections.data_table_section(view)
+
+    resultados = []
+    for display_option in DISPLAY_OPTIONS:
+        view = get_view(dataset, "Todas", "Todas", display_option)
+        etapas = {
+            "completa": lambda d=display_option: (create_sidebar(dataset), _pagina(d)),
+            **{nome: (lambda f=secao, v=view: f(dataset, v)) for nome, secao in secoes.items()},
+            "tabela": lambda v=view: sections.data_table_section(v)
+        }
+        for nome, func in etapas.items():
+            # Primeira execução fora da medida: preenche os caches de figuras
+            func()
+            resultado = time_stage(func, repeticoes)
+            resultado.update({"tamanho": n_escolas, "visao": display_option, "execucao": nome})
+            resultados.append(resultado)
+            etapa = f"interacao.{display_option.lower()}.{nome}"
+            print(f"{n_escolas:>10,} {etapa:<45} {resultado['mediana_s'] * 1000:>10.1f} ms")
+
+    invalidate_views()
+    invalidate_figures()
+    return resultados
+
+def measure_periods(n_escolas, seed, atrasos=PERIOD_DELAYS):
+    """
+    Tempo total de load_periods com downloads simulados (cada aba espera o seu
+    atraso e então limpa o CSV exportado), em sequência e em paralelo: em paralelo
+    o total deve acompanhar a aba mais lenta, não a soma das abas
+    """
+    _, _, raw = make_fixture(n_escolas, seed)
+    abas = {f"Período {i}": atraso for i, atraso in enumerate(atrasos, start=1)}
+
+    def _fetch_stub(aba):
+        time.sleep(abas[aba])
+        return clean_data(parse_csv(raw))
+
+    resultados = []
+    for modo, workers in (("sequencial", 1), ("paralelo", len(abas))):
+        inicio = time.perf_counter()
+        df = load_periods(abas, max_workers=workers, fetch=_fetch_stub)
+        total = time.perf_counter() - inicio
+        resultados.append({
+            "tamanho": n_escolas,
+            "modo": modo,
+            "abas": len(abas),
+            "linhas": len(df),
+            "total_s": total,
+            "aba_mais_lenta_s": max(atrasos),
+            "soma_abas_s": sum(atrasos)
+        })
+        print(f"{n_escolas:>10,} periodos.{modo:<36} {total * 1000:>10.1f} ms "
+              f"(aba mais lenta: {max(atrasos) * 1000:.0f} ms, soma: {sum(atrasos) * 1000:.0f} ms)")
+    return resultados
+
+def _count_nodes(bloco, contagem):
+    for filho in bloco.children.values():
+        contagem[filho.type] = contagem.get(filho.type, 0) + 1
+        if getattr(filho, "children", None):
+            _count_nodes(filho, contagem)
+
+def count_elements(app_path=APP_PATH):
+    """
+    Executa o dashboard (com AppTest) em cada visualização e conta os elementos
+    da área principal e da barra lateral: cada um é uma mensagem (delta) enviada
+    ao navegador a cada execução
+    """
+    from streamlit.testing.v1 import AppTest
+
+    resultados = []
+    at = AppTest.from_file(app_path, default_timeout=300).run()
+    for display_option in DISPLAY_OPTIONS:
+        at.sidebar.radio[0].set_value(display_option).run()
+        if at.exception:
+            raise RuntimeError(f"Falha ao executar o dashboard: {at.exception}")
+
+        principal, lateral = {}, {}
+        _count_nodes(at.main, principal)
+        _count_nodes(at.sidebar, lateral)
+        resultados.append({
+            "visao": display_option,
+            "principal": sum(principal.values()),
+            "barra_lateral": sum(lateral.values()),
+            "por_tipo": principal
+        })
+        print(f"elementos.{display_option.lower():<36} {sum(principal.values()):>10} "
+              f"(barra lateral: {sum(lateral.values())})")
+    return resultados
+
+def compare(resultados, base, limite):
+    """
+    Compara as medianas com uma execução anterior e retorna as regressões
+    """
+    anteriores = {(r["tamanho"], r["etapa"]): r for r in base["resultados"]}
+    regressoes = []
+
+    print(f"\n{'tamanho':>10} {'etapa':<45} {'razão':>8}")
+    for r in resultados:
+        anterior = anteriores.get((r["tamanho"], r["etapa"]))
+        if anterior is None or anterior["mediana_s"] == 0:
+            continue
+        razao = r["mediana_s"] / anterior["mediana_s"]
+        marca = "  <-- regressão" if razao > limite else ""
+        print(f"{r['tamanho']:>10,} {r['etapa']:<45} {razao:>8.2f}{marca}")
+        if razao > limite:
+            regressoes.append(r)
+
+    return regressoes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede cada etapa de uma execução do dashboard")
+    parser.add_argument(
+        "--tamanhos", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="Números de escolas a medir (padrão: 150 10000 1000000)"
+    )
+    parser.add_argument("--repeticoes", type=int, default=5, help="Repetições por etapa (padrão: 5)")
+    parser.add_argument("--seed", type=int, default=42, help="Semente dos dados de exemplo")
+    parser.add_argument("--saida", default="benchmark_results.json", help="Arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument(
+        "--limite", type=float, default=DEFAULT_REGRESSION_LIMIT,
+        help="Razão máxima aceita entre as medianas na comparação (padrão: 1.2)"
+    )
+    parser.add_argument(
+        "--motores", nargs="+", default=available_engines(),
+        help="Motores de consulta a comparar (padrão: todos os disponíveis)"
+    )
+    parser.add_argument(
+        "--limite-memoria", type=float, default=DEFAULT_MEMORY_LIMIT,
+        help="Pico de memória máximo por execução, em múltiplos do tamanho dos dados (padrão: 5.0)"
+    )
+    parser.add_argument(
+        "--limite-elementos", type=int, default=DEFAULT_ELEMENT_LIMIT,
+        help="Elementos máximos na área principal por execução do dashboard (padrão: 40)"
+    )
+    args = parser.parse_args(argv)
+
+    resultados = []
+    memoria = []
+    interacoes = []
+    periodos = []
+    divergencias = []
+    for n_escolas in args.tamanhos:
+        resultados.extend(benchmark_size(n_escolas, args.repeticoes, args.seed, args.motores))
+        memoria.extend(measure_rerun_memory(n_escolas, args.seed))
+        interacoes.extend(measure_interactions(n_escolas, args.seed, args.repeticoes))
+        periodos.extend(measure_periods(n_escolas, args.seed))
+
+        # Os motores devem retornar exatamente os mesmos dados
+        df, _, _ = make_fixture(n_escolas, args.seed)
+        divergencias.extend(check_engine_parity(df, build_cube(df), build_filter_index(df), args.motores))
+
+    # Mensagens enviadas ao navegador por execução (com os dados do próprio dashboard)
+    elementos = count_elements()
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump({
+            "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "seed": args.seed,
+            "motores": args.motores,
+            "resultados": resultados,
+            "memoria": memoria,
+            "divergencias": divergencias,
+            "interacoes": interacoes,
+            "periodos": periodos,
+            "elementos": elementos
+        }, f, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+    for divergencia in divergencias:
+        print(f"Motores divergentes: {divergencia}")
+
+    # O pico de memória não deve crescer com cópias do dataframe inteiro
+    excessos = check_memory(memoria, args.limite_memoria)
+    for m in excessos:
+        print(f"Pico de memória acima do limite: {m['tamanho']:,} escolas, {m['visao']} ({m['razao']:.2f}x os dados)")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = compare(resultados, json.load(f), args.limite)
+        if regressoes:
+            sys.exit(1)
+
+    # Cada seção em HTML é um único bloco: o número de elementos não cresce com as listas
+    excesso_elementos = [e for e in elementos if e["principal"] > args.limite_elementos]
+    for e in excesso_elementos:
+        print(f"Elementos acima do limite: {e['visao']} ({e['principal']} na área principal)")
+
+    if excessos or divergencias or excesso_elementos:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,1090 @@
+import os
+import io
+import json
+import hashlib
+import pyarrow.feather as feather
+import threading
+import time
+import logging
+import glob
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import pandas as pd
 import numpy as np
+from pandas.api.types import union_categoricals
 import urllib.parse
+import urllib.request
+import urllib.error
 import gspread
 from google.oauth2 import service_account
-from gspread_dataframe import get_as_dataframe
-from utils import create_sample_data
+from gspread.utils import ValueRenderOption
+from utils import (
+    DATA_SCHEMA, create_sample_data, apply_schema, build_cube, update_cube, build_filter_index,
+    build_view_model, normalize_selection, build_filter_options, filter_dataframe
+)
+from engines import get_engine
+from exports import export_bytes
 
-@st.cache_data(ttl=600)
-def load_data():
+logger = logging.getLogger(__name__)
+
+# Fonte dos dados
+SHEET_ID = "1TGUZU3v9ysTEgx_e8UHkSPl_MHxH9iNXf3AXuJCVVRU"
+SHEET_NAME = "Balanço Atualizado"
+
+# Colunas da planilha efetivamente usadas pelo dashboard
+SOURCE_COLUMNS = ['GRE', 'CIDADE', 'ESCOLA', 'INSCRITOS', 'MATRÍCULAS DE 3ª SÉRIE']
+
+# Chave estável de cada escola e colunas calculadas a partir das contagens
+KEY_COLUMNS = ['GRE', 'CIDADE', 'ESCOLA']
+DERIVED_COLUMNS = ['TAXA_EFICIENCIA', 'CATEGORIA']
+
+# Atualização incremental: recalcular apenas as escolas novas ou alteradas
+INCREMENTAL_INGEST = os.environ.get("PRIMEIRA_CHANCE_INCREMENTAL", "1") != "0"
+
+# Número máximo de abas baixadas ao mesmo tempo em load_periods
+MAX_FETCH_WORKERS = 8
+
+# Tempo máximo (segundos) de espera pelo download da planilha
+FETCH_TIMEOUT = 30
+
+# Intervalo (segundos) entre as atualizações feitas em segundo plano
+REFRESH_INTERVAL = int(os.environ.get("PRIMEIRA_CHANCE_REFRESH_INTERVAL", 600))
+
+# Snapshot local (Arrow IPC) dos dados já limpos
+SNAPSHOT_DIR = os.environ.get(
+    "PRIMEIRA_CHANCE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "dados.arrow")
+SNAPSHOT_META_PATH = os.path.join(SNAPSHOT_DIR, "dados.json")
+
+# Modo somente snapshot: o dashboard não baixa nem limpa a planilha, apenas lê
+# a versão mais recente gerada pela ingestão offline (ingest.py)
+SNAPSHOT_ONLY = os.environ.get("PRIMEIRA_CHANCE_SNAPSHOT_ONLY", "0") == "1"
+CURRENT_POINTER = "atual.json"
+
+# Versões antigas mantidas pela ingestão offline
+KEEP_VERSIONS = 3
+
+# Memória máxima (MiB) ocupada pelas visões já preparadas, compartilhadas entre sessões
+VIEW_CACHE_MB = int(os.environ.get("PRIMEIRA_CHANCE_VIEW_CACHE_MB", 256))
+
+# Memória máxima (MiB) ocupada pelos arquivos de exportação já gerados
+EXPORT_CACHE_MB = int(os.environ.get("PRIMEIRA_CHANCE_EXPORT_CACHE_MB", 64))
+
+# Memória máxima (MiB) ocupada pelas figuras já serializadas
+FIGURE_CACHE_MB = int(os.environ.get("PRIMEIRA_CHANCE_FIGURE_CACHE_MB", 128))
+
+@dataclass(frozen=True)
+class DatasetChanges:
+    """
+    Escolas adicionadas, alteradas ou removidas em relação à versão anterior,
+    com as GREs e os pares (GRE, CIDADE) afetados
+    """
+    chaves: frozenset
+    gres: frozenset
+    cidades: frozenset
+
+    def __bool__(self):
+        return bool(self.chaves)
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    Versão publicada dos dados limpos. Nunca é alterada depois de publicada:
+    cada atualização publica um novo objeto.
+    """
+    df: pd.DataFrame
+    versao: str
+    atualizado_em: float
+    # Alterações em relação à versão anterior (None quando tudo foi recalculado)
+    alteracoes: DatasetChanges = None
+    # Estruturas já calculadas desta versão (cube, filter_index, filter_options, ...): podem ser
+    # passadas na criação (ex.: cubo lido do snapshot) e as demais são calculadas sob demanda
+    estruturas: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def renewed(self, atualizado_em):
+        """
+        Mesma versão com nova data de atualização, preservando as estruturas já calculadas
+        """
+        return replace(self, atualizado_em=atualizado_em, estruturas=dict(self.estruturas))
+
+    def _structure(self, nome, build):
+        """
+        Estrutura `nome` desta versão, calculada com `build` apenas na primeira vez
+        """
+        valor = self.estruturas.get(nome)
+        if valor is None:
+            valor = self.estruturas.setdefault(nome, build())
+        return valor
+
+    @property
+    def cube(self):
+        """
+        Inscritos, matrículas e número de escolas por (GRE, CIDADE),
+        calculado uma única vez por versão
+        """
+        return self._structure("cube", lambda: build_cube(self.df))
+
+    @property
+    def filter_index(self):
+        """
+        Posições das linhas por GRE e por (GRE, CIDADE), calculadas uma única vez por versão
+        """
+        return self._structure("filter_index", lambda: build_filter_index(self.df))
+
+    @property
+    def filter_options(self):
+        """
+        GREs, cidades e número de escolas exibidos nos filtros, calculados uma única vez por versão
+        """
+        return self._structure("filter_options", lambda: build_filter_options(self.filter_index))
+
+    @property
+    def school_names_unique(self):
+        """
+        Se nenhuma escola repete o nome, verificado uma única vez por versão
+        """
+        return self._structure("nomes_unicos", lambda: bool(self.df['ESCOLA'].is_unique))
+
+# Estado compartilhado entre sessões (o módulo é importado uma única vez por processo)
+_lock = threading.Lock()
+_publicado = threading.Event()
+_estado = {
+    "dataset": None,
+    "refresher": None
+}
+
+# Saúde da atualização em segundo plano
+_saude = {
+    "ultimo_sucesso": None,
+    "ultimo_erro": None,
+    "ultimo_erro_em": None,
+    "duracao_download": None,
+    "duracao_processamento": None,
+    "memoria_dados": None
+}
+
+# Validadores da última resposta usada (ETag/Last-Modified e hash do conteúdo bruto)
+_validadores = {
+    "etag": None,
+    "last_modified": None,
+    "hash": None
+}
+
+# Cliente gspread autorizado e handles das abas, reaproveitados no processo
+_gspread_lock = threading.Lock()
+_gspread = {
+    "client": None,
+    "spreadsheet": None,
+    "worksheets": {}
+}
+
+# Quantas atualizações puderam pular a limpeza (hit) ou precisaram refazê-la (miss)
+_fetch_stats = {
+    "hits": 0,
+    "misses": 0
+}
+
+class VersionedCache:
+    """
+    Cache LRU compartilhado entre sessões, limitado em memória. As chaves começam
+    pela versão dos dados, para descartar de uma vez tudo o que for de versões antigas.
+    """
+
+    def __init__(self, limite_mb):
+        self.limite_bytes = limite_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "bytes": 0
+        }
+
+    def get(self, chave):
+        """
+        Retorna o valor guardado em `chave` (ou None), contando acerto ou falta
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self._stats["misses"] += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self._stats["hits"] += 1
+            return entrada[0]
+
+    def put(self, chave, valor, tamanho):
+        """
+        Guarda `valor` (que ocupa `tamanho` bytes), descartando os menos usados
+        até caber no limite; valores maiores que o limite não são guardados
+        """
+        if tamanho > self.limite_bytes:
+            return
+        with self._lock:
+            if chave in self._entradas:
+                return
+            self._entradas[chave] = (valor, tamanho)
+            self._stats["bytes"] += tamanho
+            while self._stats["bytes"] > self.limite_bytes:
+                _, (_, antigo) = self._entradas.popitem(last=False)
+                self._stats["bytes"] -= antigo
+                self._stats["evictions"] += 1
+
+    def invalidate(self, versao=None):
+        """
+        Descarta as entradas de versões diferentes de `versao` (todas, se None)
+        """
+        with self._lock:
+            for chave in [c for c in self._entradas if c[0] != versao]:
+                self._stats["bytes"] -= self._entradas.pop(chave)[1]
+
+    def stats(self):
+        """
+        Acertos, faltas, descartes, taxa de acerto e memória ocupada
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entradas"] = len(self._entradas)
+        consultas = stats["hits"] + stats["misses"]
+        stats["taxa_acerto"] = stats["hits"] / consultas if consultas else None
+        stats["limite_bytes"] = self.limite_bytes
+        return stats
+
+# Visões preparadas (DashboardView) por (versão, GRE, cidade, visualização)
+_views = VersionedCache(VIEW_CACHE_MB)
+
+# Arquivos de exportação por (versão, GRE, cidade, formato)
+_exports = VersionedCache(EXPORT_CACHE_MB)
+
+# Figuras serializadas (JSON) por (versão, GRE, cidade, visualização, gráfico)
+_figures = VersionedCache(FIGURE_CACHE_MB)
+
+def normalize_data(df):
+    """
+    Faz a limpeza dos dados brutos da planilha (colunas, tipos e registros
+    inválidos), sem calcular as colunas derivadas
+    """
+    df = df.dropna(how='all')
+
+    # Garantir colunas corretas
+    if 'GRE' not in df.columns or 'CIDADE' not in df.columns:
+        if len(df) > 0:
+            # Primeira linha como cabeçalho
+            df.columns = df.iloc[0]
+            df = df.drop(df.index[0])
+
+    # Mapeamento padrão
+    column_mapping = {
+        'GRE': 'GRE',
+        'CIDADE': 'CIDADE',
+        'ESCOLA': 'ESCOLA',
+        'INSCRITOS': 'INSCRITOS',
+        'MATRÍCULAS DE 3ª SÉRIE': 'MATRICULAS'
+    }
+
+    # Aplicar mapeamento para colunas existentes e descartar as demais
+    valid_mapping = {col: new_col for col, new_col in column_mapping.items() if col in df.columns}
+    df = df[list(valid_mapping)].rename(columns=valid_mapping)
+
+    # Converter GRE para string sem decimal
+    if 'GRE' in df.columns:
+        df['GRE'] = df['GRE'].astype(str).str.replace('.0', '', regex=False)
+
+    # Converter colunas numéricas
+    numeric_cols = ['INSCRITOS', 'MATRICULAS']
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Remover registros inválidos e GRE 0
+    df = df[df['MATRICULAS'] > 0]
+    if 'GRE' in df.columns:
+        df = df[df['GRE'] != '0']
+
+    # Preenchimento de NaN
+    numeric_cols = [col for col in numeric_cols if col in df.columns]
+    text_cols = [col for col in df.columns if col not in numeric_cols]
+    df = df.fillna({**{col: 0 for col in numeric_cols}, **{col: "" for col in text_cols}})
+
+    return apply_schema(df).reset_index(drop=True)
+
+def add_derived_columns(df):
+    """
+    Calcula a taxa de eficiência e a categoria de cada registro
+    """
+    df = df.copy()
+
+    # Calcular a taxa de eficiência
+    df['TAXA_EFICIENCIA'] = (df['INSCRITOS'] / df['MATRICULAS'] * 100).clip(0, 100)
+
+    # Categorizar eficiência
+    conditions = [
+        (df['TAXA_EFICIENCIA'] < 50),
+        (df['TAXA_EFICIENCIA'] >= 50) & (df['TAXA_EFICIENCIA'] < 85),
+        (df['TAXA_EFICIENCIA'] >= 85)
+    ]
+    categories = ["Baixo", "Médio", "Excelente"]
+    df['CATEGORIA'] = np.select(conditions, categories, default="N/A")
+
+    return apply_schema(df)
+
+def clean_data(df):
+    """
+    Faz a limpeza e preparação dos dados brutos da planilha
+    """
+    return add_derived_columns(normalize_data(df))
+
+def _same_keys(atual, novo):
     """
-    Carrega os dados da planilha do Google Sheets ou cria dados de exemplo
-    em caso de falha. Faz a limpeza e preparação dos dados.
+    Verifica se as duas versões têm as mesmas escolas, na mesma ordem
+    (caso comum: a planilha só teve contagens alteradas)
+    """
+    if len(atual) != len(novo):
+        return False
+    for col in KEY_COLUMNS:
+        a, b = atual[col], novo[col]
+        if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+            # Mesmas categorias: basta comparar os códigos
+            if not a.cat.categories.equals(b.cat.categories):
+                return False
+            if not np.array_equal(a.cat.codes.to_numpy(), b.cat.codes.to_numpy()):
+                return False
+        elif not a.reset_index(drop=True).equals(b.reset_index(drop=True)):
+            return False
+    return True
+
+def _key_codes(atual, novo):
+    """
+    Código inteiro da chave de cada escola (GRE + CIDADE + ESCOLA), comum às duas versões
+    """
+    chaves = np.zeros(len(atual) + len(novo), dtype=np.int64)
+    for col in KEY_COLUMNS:
+        if isinstance(atual[col].dtype, pd.CategoricalDtype) and isinstance(novo[col].dtype, pd.CategoricalDtype):
+            # Colunas categóricas: unir as categorias e usar os códigos, sem comparar textos
+            unido = union_categoricals([atual[col], novo[col]], ignore_order=True)
+            codigos, total = unido.codes, len(unido.categories)
+        else:
+            codigos, valores = pd.factorize(pd.concat([atual[col], novo[col]], ignore_index=True))
+            total = len(valores)
+        chaves = chaves * total + codigos
+    return chaves[:len(atual)], chaves[len(atual):]
+
+def _key_tuples(df, mascara):
+    """
+    Chaves (GRE, CIDADE, ESCOLA) das linhas selecionadas, como texto
+    """
+    return list(df[KEY_COLUMNS][mascara].astype(str).itertuples(index=False, name=None))
+
+def apply_delta(atual, novo):
+    """
+    Aplica uma nova exportação (já normalizada) sobre os dados atuais,
+    recalculando as colunas derivadas apenas das escolas novas ou alteradas.
+    As escolas são alinhadas pela posição quando a ordem não mudou e, senão,
+    por códigos inteiros da chave. Retorna (df, alterações) ou (None, None)
+    se não houver dados atuais ou a chave não for única.
+    """
+    if len(atual) == 0:
+        return None, None
+
+    # Posição de cada escola da nova exportação nos dados atuais (-1 para escolas novas)
+    if _same_keys(atual, novo):
+        posicao = np.arange(len(novo))
+    else:
+        chaves_atual, chaves_novo = _key_codes(atual, novo)
+        indice = pd.Index(chaves_atual)
+        if not indice.is_unique or not pd.Index(chaves_novo).is_unique:
+            return None, None
+        posicao = indice.get_indexer(chaves_novo)
+    existente = posicao >= 0
+    origem = np.where(existente, posicao, 0)
+
+    alterado = ~existente
+    for col in ['INSCRITOS', 'MATRICULAS']:
+        alterado |= atual[col].to_numpy()[origem] != novo[col].to_numpy()
+
+    # Colunas derivadas copiadas das escolas inalteradas; só as alteradas são recalculadas
+    taxa = atual['TAXA_EFICIENCIA'].to_numpy()[origem]
+    categoria = atual['CATEGORIA'].astype(DATA_SCHEMA['CATEGORIA']).cat.codes.to_numpy()[origem]
+    if alterado.any():
+        recalculado = add_derived_columns(novo[alterado])
+        taxa[alterado] = recalculado['TAXA_EFICIENCIA'].to_numpy()
+        categoria[alterado] = recalculado['CATEGORIA'].cat.codes.to_numpy()
+    df = novo.assign(
+        TAXA_EFICIENCIA=taxa,
+        CATEGORIA=pd.Categorical.from_codes(categoria, dtype=DATA_SCHEMA['CATEGORIA'])
+    )
+
+    # Escolas removidas: linhas atuais que não aparecem na nova exportação
+    removido = np.ones(len(atual), dtype=bool)
+    removido[posicao[existente]] = False
+
+    chaves = _key_tuples(novo, alterado) + _key_tuples(atual, removido)
+    alteracoes = DatasetChanges(
+        chaves=frozenset(chaves),
+        gres=frozenset(gre for gre, _, _ in chaves),
+        cidades=frozenset((gre, cidade) for gre, cidade, _ in chaves)
+    )
+
+    return apply_schema(df), alteracoes
+
+def parse_csv(raw):
+    """
+    Lê o CSV exportado apenas com as colunas usadas. Se o cabeçalho não estiver
+    na primeira linha, lê a planilha inteira e deixa a correção para clean_data.
+    """
+    try:
+        return pd.read_csv(io.BytesIO(raw), usecols=SOURCE_COLUMNS, dtype=str, engine="pyarrow")
+    except (ValueError, KeyError):
+        return pd.read_csv(io.BytesIO(raw))
+
+def _sheet_url(sheet_name):
+    """
+    URL de exportação em CSV de uma aba da planilha
+    """
+    encoded_sheet_name = urllib.parse.quote(sheet_name)
+    return f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/gviz/tq?tqx=out:csv&sheet={encoded_sheet_name}"
+
+def _download_csv(url, validadores=None):
+    """
+    Baixa o CSV exportado enviando os validadores da resposta anterior, se houver.
+    Retorna (conteúdo bruto, cabeçalhos), com conteúdo None se o servidor
+    responder 304 (não modificado).
+    """
+    validadores = validadores or {}
+    headers = {}
+    if validadores.get("etag"):
+        headers["If-None-Match"] = validadores["etag"]
+    if validadores.get("last_modified"):
+        headers["If-Modified-Since"] = validadores["last_modified"]
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            return response.read(), response.headers
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, e.headers
+        raise
+
+def _has_service_account():
+    """
+    Verifica se há credenciais de conta de serviço configuradas
     """
     try:
-        # Conectar com Google Sheets
-        sheet_id = "1TGUZU3v9ysTEgx_e8UHkSPl_MHxH9iNXf3AXuJCVVRU"
-        sheet_name = "Balanço Atualizado"
-        encoded_sheet_name = urllib.parse.quote(sheet_name)
-        url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={encoded_sheet_name}"
+        return "gcp_service_account" in st.secrets
+    except Exception:
+        return False
+
+def _authorize():
+    """
+    Cria o cliente gspread com a conta de serviço configurada. A sessão
+    autorizada renova o token de acesso sozinha quando ele expira.
+    """
+    credentials = service_account.Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"],
+        scopes=gspread.auth.DEFAULT_SCOPES
+    )
+    return gspread.authorize(credentials)
+
+def get_worksheet(sheet_name, authorize=None):
+    """
+    Retorna o handle da aba, reaproveitando o cliente autorizado e a planilha
+    já abertos no processo. `authorize` permite trocar a criação do cliente
+    (ex.: por um stub local da API em benchmarks).
+    """
+    with _gspread_lock:
+        if _gspread["client"] is None:
+            _gspread["client"] = (authorize or _authorize)()
+        if _gspread["spreadsheet"] is None:
+            _gspread["spreadsheet"] = _gspread["client"].open_by_key(SHEET_ID)
+        worksheet = _gspread["worksheets"].get(sheet_name)
+        if worksheet is None:
+            worksheet = _gspread["spreadsheet"].worksheet(sheet_name)
+            _gspread["worksheets"][sheet_name] = worksheet
+        return worksheet
+
+def reset_gspread_pool():
+    """
+    Descarta o cliente e os handles em cache (próxima leitura autoriza de novo)
+    """
+    with _gspread_lock:
+        _gspread["client"] = None
+        _gspread["spreadsheet"] = None
+        _gspread["worksheets"] = {}
+
+def values_to_frame(values):
+    """
+    Converte a matriz de valores brutos da aba no mesmo formato lido do CSV:
+    apenas as colunas usadas, com células vazias como NaN
+    """
+    if not values:
+        return pd.DataFrame(columns=SOURCE_COLUMNS)
 
+    df = pd.DataFrame(values[1:], columns=values[0]).replace("", None)
+    if all(col in df.columns for col in SOURCE_COLUMNS):
+        df = df[SOURCE_COLUMNS]
+    return df
+
+def _read_worksheet(sheet_name, authorize=None):
+    """
+    Lê uma aba via gspread (alternativa quando a exportação em CSV falha),
+    numa única requisição com os valores brutos de toda a aba
+    """
+    for tentativa in range(2):
+        worksheet = get_worksheet(sheet_name, authorize)
         try:
-            # Tentativa via pandas
-            df = pd.read_csv(url)
-        except Exception as e:
-            # Falha silenciosa, tentativa via gspread
+            values = worksheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+            break
+        except Exception:
+            # Credencial revogada ou aba recriada: autorizar e abrir de novo uma vez
+            reset_gspread_pool()
+            if tentativa:
+                raise
+    return values_to_frame(values)
+
+def _process(bruto, anterior=None):
+    """
+    Limpa a exportação. No modo incremental, com dados anteriores disponíveis,
+    recalcula apenas as escolas novas ou alteradas.
+    Retorna (df, alterações), com alterações None quando tudo foi recalculado.
+    """
+    if anterior is None or not INCREMENTAL_INGEST:
+        return clean_data(bruto), None
+
+    novo = normalize_data(bruto)
+    df, alteracoes = apply_delta(anterior, novo)
+    if df is None:
+        return add_derived_columns(novo), None
+    return df, alteracoes
+
+def fetch_data(anterior=None):
+    """
+    Baixa a planilha do Google Sheets (CSV ou, em caso de falha, gspread).
+    Retorna (df limpo, validadores, alterações em relação a `anterior`) ou
+    (None, validadores, None) quando a planilha não mudou desde a última
+    atualização. Lança exceção se nenhuma fonte responder.
+    """
+    inicio = time.perf_counter()
+    try:
+        # Tentativa via CSV exportado, com requisição condicional
+        raw, headers = _download_csv(_sheet_url(SHEET_NAME), _validadores)
+    except Exception:
+        # Falha silenciosa, tentativa via gspread
+        if not _has_service_account():
+            raise
+        bruto = _read_worksheet(SHEET_NAME)
+        meio = time.perf_counter()
+        df, alteracoes = _process(bruto, anterior)
+        _record_durations(inicio, meio)
+        return df, {"etag": None, "last_modified": None, "hash": None}, alteracoes
+
+    if raw is None:
+        _record_durations(inicio)
+        return None, dict(_validadores), None
+
+    validadores = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "hash": hashlib.sha256(raw).hexdigest()[:16]
+    }
+
+    # Conteúdo idêntico ao anterior: não há o que reprocessar
+    if validadores["hash"] == _validadores["hash"]:
+        _record_durations(inicio)
+        return None, validadores, None
+
+    meio = time.perf_counter()
+    df, alteracoes = _process(parse_csv(raw), anterior)
+    _record_durations(inicio, meio)
+    return df, validadores, alteracoes
+
+def _record_durations(inicio, meio=None):
+    """
+    Registra quanto tempo levaram o download e o processamento da última atualização
+    """
+    fim = time.perf_counter()
+    meio = meio or fim
+    with _lock:
+        _saude["duracao_download"] = meio - inicio
+        _saude["duracao_processamento"] = fim - meio
+
+def fetch_sheet(sheet_name):
+    """
+    Baixa e limpa uma aba qualquer da planilha (sem requisição condicional)
+    """
+    try:
+        raw, _ = _download_csv(_sheet_url(sheet_name))
+        bruto = parse_csv(raw)
+    except Exception:
+        if not _has_service_account():
+            raise
+        bruto = _read_worksheet(sheet_name)
+    return clean_data(bruto)
+
+def load_periods(sheet_names, max_workers=MAX_FETCH_WORKERS, fetch=fetch_sheet):
+    """
+    Baixa e limpa várias abas (períodos) em paralelo e junta os resultados
+    em formato longo, identificando a origem de cada registro na coluna PERIODO.
+    `fetch` permite trocar a leitura de cada aba (ex.: por um stub em benchmarks).
+    """
+    sheet_names = list(sheet_names)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sheet_names)))) as executor:
+        frames = list(executor.map(fetch, sheet_names))
+
+    df = pd.concat(
+        [frame.assign(PERIODO=sheet_name) for sheet_name, frame in zip(sheet_names, frames)],
+        ignore_index=True
+    )
+    return apply_schema(df)
+
+def get_fetch_stats():
+    """
+    Retorna os contadores de atualizações que pularam (hits)
+    ou refizeram (misses) a leitura e limpeza dos dados
+    """
+    with _lock:
+        return dict(_fetch_stats)
+
+def get_data_version():
+    """
+    Retorna o identificador da versão dos dados publicados
+    """
+    with _lock:
+        dataset = _estado["dataset"]
+    return dataset.versao if dataset is not None else None
+
+def get_health():
+    """
+    Retorna o estado da atualização em segundo plano: último sucesso,
+    último erro, duração do download e do processamento, versão publicada
+    e uso dos caches de visões, exportações e figuras
+    """
+    with _lock:
+        saude = dict(_saude)
+        saude.update(_fetch_stats)
+        dataset = _estado["dataset"]
+    saude["versao"] = dataset.versao if dataset is not None else None
+    saude["atualizado_em"] = dataset.atualizado_em if dataset is not None else None
+    saude["visoes"] = get_view_stats()
+    saude["exportacoes"] = get_export_stats()
+    saude["figuras"] = get_figure_stats()
+    return saude
+
+def _frame_bytes(frame, base):
+    """
+    Memória própria de um resultado (zero quando ele é o próprio dataframe publicado)
+    """
+    if frame is base:
+        return 0
+    return int(frame.memory_usage(deep=True).sum())
+
+def get_view(dataset, filtro_gre="Todas", filtro_cidade="Todas", display_option="Escolas"):
+    """
+    Retorna a visão do dashboard (DashboardView) para os filtros, reaproveitando
+    o resultado entre sessões enquanto a versão dos dados for a mesma.
+    Os dataframes devolvidos são compartilhados: devem ser tratados como somente leitura.
+    """
+    if display_option != "Escolas":
+        filtro_cidade = "Todas"
+    filtro_gre, filtro_cidade = normalize_selection(filtro_gre), normalize_selection(filtro_cidade)
+    chave = (dataset.versao, filtro_gre, filtro_cidade, display_option)
+
+    resultado = _views.get(chave)
+    if resultado is not None:
+        return resultado
+
+    # Filtros e agrupamentos pelo motor configurado (pandas por padrão)
+    engine = get_engine()
+    filtered_df, grouped_df, column_name = engine.prepare(
+        dataset.df, filtro_gre, filtro_cidade, display_option,
+        cube=dataset.cube if engine.name == "pandas" else None,
+        index=dataset.filter_index if engine.name == "pandas" else None,
+        versao=dataset.versao
+    )
+    resultado = build_view_model(
+        filtered_df, grouped_df, column_name, display_option,
+        nomes_unicos=column_name == 'ESCOLA' and dataset.school_names_unique
+    )
+    tamanho = _frame_bytes(resultado.filtered_df, dataset.df) + _frame_bytes(resultado.grouped_df, dataset.df)
+    _views.put(chave, resultado, tamanho)
+    return resultado
+
+def invalidate_views(versao=None):
+    """
+    Descarta as visões preparadas de versões diferentes de `versao` (todas, se None)
+    """
+    _views.invalidate(versao)
+
+def get_view_stats():
+    """
+    Retorna acertos, faltas, descartes, taxa de acerto e memória ocupada
+    pelas visões preparadas
+    """
+    return _views.stats()
+
+def get_export(dataset, formato="CSV", filtro_gre="Todas", filtro_cidade="Todas"):
+    """
+    Retorna o arquivo de exportação (bytes) das escolas que atendem aos filtros
+    ("Todas" exporta todos os dados), gerado no máximo uma vez por versão,
+    filtros e formato
+    """
+    filtro_gre, filtro_cidade = normalize_selection(filtro_gre), normalize_selection(filtro_cidade)
+    chave = (dataset.versao, filtro_gre, filtro_cidade, formato)
+
+    conteudo = _exports.get(chave)
+    if conteudo is not None:
+        return conteudo
+
+    filtered_df = filter_dataframe(dataset.df, dataset.filter_index, filtro_gre, filtro_cidade)
+    conteudo = export_bytes(filtered_df, formato)
+    _exports.put(chave, conteudo, len(conteudo))
+    return conteudo
+
+def invalidate_exports(versao=None):
+    """
+    Descarta os arquivos de exportação de versões diferentes de `versao` (todos, se None)
+    """
+    _exports.invalidate(versao)
+
+def get_export_stats():
+    """
+    Retorna acertos, faltas, descartes, taxa de acerto e memória ocupada
+    pelos arquivos de exportação
+    """
+    return _exports.stats()
+
+def get_figure(dataset, grafico, construir, filtro_gre="Todas", filtro_cidade="Todas", display_option="Escolas"):
+    """
+    Retorna a figura `grafico` da visão pedida serializada em JSON, construída
+    (por `construir`, que retorna a figura Plotly) no máximo uma vez por versão,
+    filtros e visualização, e compartilhada entre sessões
+    """
+    if display_option != "Escolas":
+        filtro_cidade = "Todas"
+    chave = (
+        dataset.versao, normalize_selection(filtro_gre), normalize_selection(filtro_cidade),
+        display_option, grafico
+    )
+
+    figura_json = _figures.get(chave)
+    if figura_json is None:
+        figura_json = construir().to_json()
+        _figures.put(chave, figura_json, len(figura_json))
+    return figura_json
+
+def invalidate_figures(versao=None):
+    """
+    Descarta as figuras de versões diferentes de `versao` (todas, se None)
+    """
+    _figures.invalidate(versao)
+
+def get_figure_stats():
+    """
+    Retorna acertos, faltas, descartes, taxa de acerto e memória ocupada
+    pelas figuras serializadas
+    """
+    return _figures.stats()
+
+def read_snapshot(path=SNAPSHOT_PATH, meta_path=SNAPSHOT_META_PATH):
+    """
+    Lê o snapshot local, retornando (df, data de gravação, validadores)
+    ou (None, 0, {}) se não existir
+    """
+    try:
+        df = pd.read_feather(path)
+        carregado_em = os.path.getmtime(path)
+    except Exception:
+        return None, 0.0, {}
+
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            validadores = json.load(f)
+    except Exception:
+        validadores = {}
+
+    return df, carregado_em, validadores
+
+def _write_atomic(path, write):
+    """
+    Escreve num arquivo temporário e só então substitui o anterior
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_snapshot(df, validadores=None, path=SNAPSHOT_PATH, meta_path=SNAPSHOT_META_PATH):
+    """
+    Grava o snapshot (e os validadores da resposta que o originou) de forma atômica
+    """
+    _write_atomic(path, lambda tmp: df.to_feather(tmp, compression="uncompressed"))
+
+    def _write_meta(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(validadores or {}, f)
+
+    _write_atomic(meta_path, _write_meta)
+
+def data_fingerprint(df):
+    """
+    Identificador da versão calculado a partir do conteúdo dos dados limpos
+    """
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy()).hexdigest()[:16]
+
+def publish_snapshot(df, directory=SNAPSHOT_DIR):
+    """
+    Grava uma versão pronta para servir (dados e agregados por GRE e cidade,
+    e por período quando houver a coluna PERIODO) e só então aponta o ponteiro da versão atual para ela. Retorna a versão.
+    """
+    versao = data_fingerprint(df)
+    dados = f"dados-{versao}.arrow"
+    agregados = f"agregados-{versao}.arrow"
+
+    # Em formato longo (load_periods), os agregados são separados por período
+    chaves = ['PERIODO', 'GRE', 'CIDADE'] if 'PERIODO' in df.columns else ['GRE', 'CIDADE']
+
+    _write_atomic(os.path.join(directory, dados), lambda tmp: df.to_feather(tmp, compression="uncompressed"))
+    _write_atomic(
+        os.path.join(directory, agregados),
+        lambda tmp: build_cube(df, chaves).to_feather(tmp, compression="uncompressed")
+    )
+
+    def _write_pointer(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"versao": versao, "dados": dados, "agregados": agregados, "gerado_em": time.time()}, f)
+
+    _write_atomic(os.path.join(directory, CURRENT_POINTER), _write_pointer)
+
+    # Remover versões antigas (mantendo as mais recentes para leitores em andamento)
+    antigas = sorted(glob.glob(os.path.join(directory, "dados-*.arrow")), key=os.path.getmtime)[:-KEEP_VERSIONS]
+    for path in antigas:
+        for antigo in (path, path.replace("dados-", "agregados-")):
             try:
-                if "gcp_service_account" in st.secrets:
-                    credentials = service_account.Credentials.from_service_account_info(
-                        st.secrets["gcp_service_account"]
-                    )
-                    gc = gspread.authorize(credentials)
-                    sh = gc.open_by_key(sheet_id)
-                    worksheet = sh.worksheet(sheet_name)
-                    df = get_as_dataframe(worksheet, evaluate_formulas=True)
-                else:
-                    # Se não tiver credenciais, use dados de exemplo
-                    return create_sample_data()
-            except Exception:
-                # Criar dados de exemplo sem alertar o usuário
-                return create_sample_data()
-
-        # Limpeza e preparação dos dados
-        df = df.dropna(how='all')
-
-        # Garantir colunas corretas
-        if 'GRE' not in df.columns or 'CIDADE' not in df.columns:
-            if len(df) > 0:
-                # Primeira linha como cabeçalho
-                df.columns = df.iloc[0]
-                df = df.drop(df.index[0])
-
-        # Mapeamento padrão
-        column_mapping = {
-            'GRE': 'GRE',
-            'CIDADE': 'CIDADE',
-            'ESCOLA': 'ESCOLA',
-            'INSCRITOS': 'INSCRITOS',
-            'MATRÍCULAS DE 3ª SÉRIE': 'MATRICULAS'
-        }
+                os.remove(antigo)
+            except OSError:
+                pass
+
+    return versao
+
+def read_current_pointer(directory=SNAPSHOT_DIR):
+    """
+    Lê o ponteiro da versão atual gerada pela ingestão offline (ou None)
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_POINTER), encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def read_published_snapshot(pointer, directory=SNAPSHOT_DIR):
+    """
+    Lê os dados e os agregados da versão indicada pelo ponteiro. Os arquivos são
+    mapeados em memória, mas a conversão para pandas copia as colunas.
+    """
+    dados = feather.read_table(os.path.join(directory, pointer["dados"]), memory_map=True)
+    agregados = feather.read_table(os.path.join(directory, pointer["agregados"]), memory_map=True)
+    return dados.to_pandas(), agregados.to_pandas()
+
+def _publish(df, atualizado_em, validadores=None, alteracoes=None, cube=None):
+    """
+    Publica uma nova versão dos dados (referência única, trocada sob lock)
+    """
+    validadores = validadores or {}
+
+    with _lock:
+        anterior = _estado["dataset"]
+    if cube is None and alteracoes is not None and anterior is not None and "cube" in anterior.estruturas:
+        # Atualização incremental: recalcular só os pares (GRE, CIDADE) afetados
+        cube = update_cube(anterior.cube, df, alteracoes.cidades)
+
+    dataset = Dataset(
+        df=df,
+        versao=validadores.get("hash") or f"local-{int(atualizado_em)}",
+        atualizado_em=atualizado_em,
+        alteracoes=alteracoes,
+        estruturas={} if cube is None else {"cube": cube}
+    )
+
+    memoria = int(df.memory_usage(deep=True).sum())
+    logger.info("Versão %s publicada: %d registros, %.1f KiB", dataset.versao, len(df), memoria / 1024)
+    with _lock:
+        _estado["dataset"] = dataset
+        _saude["memoria_dados"] = memoria
+        for chave in _validadores:
+            _validadores[chave] = validadores.get(chave)
+    _publicado.set()
+
+    # Visões, exportações e figuras de versões anteriores não serão mais pedidas
+    invalidate_views(dataset.versao)
+    invalidate_exports(dataset.versao)
+    invalidate_figures(dataset.versao)
+    return dataset
+
+def refresh_data():
+    """
+    Busca dados novos e, somente em caso de sucesso, atualiza o snapshot
+    e publica a nova versão. Retorna True se a atualização funcionou.
+    """
+    with _lock:
+        atual = _estado["dataset"]
+
+    try:
+        df, validadores, alteracoes = fetch_data(atual.df if atual is not None else None)
+    except Exception as e:
+        logger.warning("Falha ao atualizar os dados da planilha", exc_info=True)
+        _record_error(e)
+        return False
 
-        # Aplicar mapeamento para colunas existentes
-        valid_mapping = {col: new_col for col, new_col in column_mapping.items() if col in df.columns}
-        df = df.rename(columns=valid_mapping)
+    if alteracoes is not None and not alteracoes:
+        # Nenhuma escola mudou (apenas colunas não usadas): manter a versão atual
+        df = None
 
-        # Converter GRE para string sem decimal
-        if 'GRE' in df.columns:
-            df['GRE'] = df['GRE'].astype(str).str.replace('.0', '', regex=False)
+    if df is None:
+        # Planilha inalterada: apenas renovar a data da versão atual
+        with _lock:
+            dataset = _estado["dataset"]
+            if dataset is not None:
+                _fetch_stats["hits"] += 1
+                _saude["ultimo_sucesso"] = time.time()
+                _estado["dataset"] = dataset.renewed(time.time())
+                for chave in _validadores:
+                    _validadores[chave] = validadores.get(chave)
+                return True
+            # Sem dados publicados para reaproveitar: forçar o download completo
+            _validadores.update({"etag": None, "last_modified": None, "hash": None})
+        return refresh_data()
 
-        # Converter colunas numéricas
-        numeric_cols = ['INSCRITOS', 'MATRICULAS']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+    with _lock:
+        _fetch_stats["misses"] += 1
 
-        # Remover registros inválidos e GRE 0
-        df = df[df['MATRICULAS'] > 0]
-        if 'GRE' in df.columns:
-            df = df[df['GRE'] != '0']
+    try:
+        write_snapshot(df, validadores)
+    except Exception:
+        logger.warning("Falha ao gravar o snapshot local", exc_info=True)
 
-        # Preenchimento de NaN
-        df = df.fillna(0)
+    _publish(df, time.time(), validadores, alteracoes)
+    with _lock:
+        _saude["ultimo_sucesso"] = time.time()
+    return True
 
-        # Calcular a taxa de eficiência
-        df['TAXA_EFICIENCIA'] = (df['INSCRITOS'] / df['MATRICULAS'] * 100).clip(0, 100)
+def _refresher_loop(intervalo):
+    """
+    Laço da thread de atualização: atualiza e espera o intervalo configurado
+    """
+    with _lock:
+        dataset = _estado["dataset"]
+    # Um snapshot recente não precisa ser atualizado imediatamente
+    espera = 0
+    if dataset is not None:
+        espera = max(0, intervalo - (time.time() - dataset.atualizado_em))
 
-        # Categorizar eficiência
-        conditions = [
-            (df['TAXA_EFICIENCIA'] < 50),
-            (df['TAXA_EFICIENCIA'] >= 50) & (df['TAXA_EFICIENCIA'] < 85),
-            (df['TAXA_EFICIENCIA'] >= 85)
-        ]
-        categories = ["Baixo", "Médio", "Excelente"]
-        df['CATEGORIA'] = np.select(conditions, categories, default="N/A")
+    while True:
+        time.sleep(espera)
+        try:
+            if not refresh_data() and not _publicado.is_set():
+                # Nenhuma fonte respondeu e não há o que servir: usar dados de exemplo
+                _publish(create_sample_data(), time.time(), {"hash": "amostra"})
+        except Exception as e:
+            # Um erro inesperado (ex.: ao publicar) não pode encerrar a thread
+            logger.exception("Falha inesperada na atualização dos dados")
+            _record_error(e)
+            _publish_fallback()
+        espera = intervalo
 
-        return df
+def _record_error(e):
+    """
+    Registra o último erro da atualização em segundo plano (ver get_health)
+    """
+    with _lock:
+        _saude["ultimo_erro"] = f"{type(e).__name__}: {e}"
+        _saude["ultimo_erro_em"] = time.time()
 
+def _publish_fallback():
+    """
+    Publica dados de exemplo se nada foi publicado ainda, para que as sessões
+    que esperam a primeira versão (ver get_dataset) não fiquem bloqueadas
+    """
+    if _publicado.is_set():
+        return
+    try:
+        _publish(create_sample_data(), time.time(), {"hash": "amostra"})
     except Exception as e:
-        # Em caso de erro, retornar dados de exemplo
-        return create_sample_data()
\ No newline at end of file
+        logger.exception("Falha ao publicar os dados de exemplo")
+        _record_error(e)
+
+def _snapshot_loop(intervalo):
+    """
+    Laço da thread no modo somente snapshot: publica cada nova versão
+    gerada pela ingestão offline, sem baixar nem processar a planilha
+    """
+    while True:
+        try:
+            pointer = read_current_pointer()
+        except Exception as e:
+            logger.exception("Falha inesperada ao ler o ponteiro da versão atual")
+            _record_error(e)
+            pointer = None
+        if pointer is not None and pointer["versao"] != get_data_version():
+            try:
+                df, cube = read_published_snapshot(pointer)
+                _publish(df, pointer["gerado_em"], {"hash": pointer["versao"]}, cube=cube)
+                with _lock:
+                    _saude["ultimo_sucesso"] = time.time()
+            except Exception as e:
+                logger.warning("Falha ao ler o snapshot %s", pointer["versao"], exc_info=True)
+                _record_error(e)
+
+        if not _publicado.is_set():
+            # Nenhuma ingestão concluída ainda: usar dados de exemplo
+            logger.warning("Nenhum snapshot em %s; usando dados de exemplo", SNAPSHOT_DIR)
+            _publish_fallback()
+
+        time.sleep(intervalo)
+
+def start_refresher(intervalo=None):
+    """
+    Inicia (uma única vez por processo) a thread que mantém os dados atualizados
+    """
+    with _lock:
+        if _estado["refresher"] is not None:
+            return
+        thread = threading.Thread(
+            target=_snapshot_loop if SNAPSHOT_ONLY else _refresher_loop,
+            args=(intervalo or REFRESH_INTERVAL,),
+            name="primeira-chance-refresher",
+            daemon=True
+        )
+        _estado["refresher"] = thread
+
+    # Servir o snapshot local enquanto a primeira atualização não termina
+    if not _publicado.is_set() and not SNAPSHOT_ONLY:
+        df, atualizado_em, validadores = read_snapshot()
+        if df is not None:
+            _publish(df, atualizado_em, validadores)
+
+    thread.start()
+
+def get_dataset():
+    """
+    Retorna a última versão publicada dos dados sem esperar por atualizações.
+    Apenas a primeira carga sem snapshot local espera a primeira publicação.
+    """
+    start_refresher()
+    _publicado.wait()
+    with _lock:
+        return _estado["dataset"]
+
+def load_data():
+    """
+    Retorna o DataFrame da última versão publicada dos dados
+    """
+    return get_dataset().df
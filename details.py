@@ -1,5 +1,8 @@
 import streamlit as st
 import pandas as pd
+from utils import RANKING_PAGE_SIZE, ranking_pages, ranking_window, ranking_window_around, search_ranking
+from visualizations import CachedFigure, create_ranking_chart
+from data_loader import get_figure
 
 def display_category_details(filtered_df):
     """
@@ -54,9 +57,6 @@ def display_data_table(table_df, column_name, display_option):
         st.warning(f"Não há dados disponíveis para exibir a tabela de {display_option}.")
         return
 
-    # Criar uma cópia do DataFrame para evitar modificar o original
-    table_df = table_df.copy()
-
     # Encontrar apenas as colunas que realmente existem no DataFrame
     # Verificar se column_name existe no DataFrame
     if column_name not in table_df.columns:
@@ -67,7 +67,8 @@ def display_data_table(table_df, column_name, display_option):
     columns_to_use = [column_name]  # Garantir que a coluna principal está presente
 
     # Verificar e adicionar colunas extras se existirem
-    for col in ['GRE', 'CIDADE', 'MATRICULAS', 'INSCRITOS', 'TAXA_EFICIENCIA', 'CATEGORIA']:
+    for col in ['GRE', 'CIDADE', 'MATRICULAS', 'INSCRITOS', 'TAXA_EFICIENCIA', 'CATEGORIA', 'RANK', 'PERCENTIL',
+                'RANK_GRE', 'PERCENTIL_GRE']:
         if col in table_df.columns and col != column_name:  # Evitar duplicação
             columns_to_use.append(col)
 
@@ -75,7 +76,8 @@ def display_data_table(table_df, column_name, display_option):
     if len(columns_to_use) < 2:
         st.warning(f"Dados insuficientes para exibir uma tabela completa de {display_option}.")
 
-    # Filtrar apenas as colunas existentes
+    # Filtrar apenas as colunas existentes (seleção sem cópia: com copy-on-write,
+    # apenas as colunas alteradas abaixo são materializadas)
     table_df = table_df[columns_to_use]
 
     # Se estamos visualizando por GREs, adicionar "GRE" antes do número
@@ -90,7 +92,11 @@ def display_data_table(table_df, column_name, display_option):
         'MATRICULAS': 'Matriculados',
         'INSCRITOS': 'Inscritos',
         'TAXA_EFICIENCIA': 'Taxa (%)',
-        'CATEGORIA': 'Categoria'
+        'CATEGORIA': 'Categoria',
+        'RANK': 'Posição',
+        'PERCENTIL': 'Percentil',
+        'RANK_GRE': 'Posição na GRE',
+        'PERCENTIL_GRE': 'Percentil na GRE'
     }
 
     # Adicionar o mapeamento para o column_name dinâmico
@@ -101,13 +107,18 @@ def display_data_table(table_df, column_name, display_option):
     valid_mapping = {col: column_mapping.get(col, col) for col in table_df.columns}
     table_df = table_df.rename(columns=valid_mapping)
 
+    # Colunas decimais exibidas com uma casa (formatação no navegador, sem copiar as colunas)
+    column_config = {
+        col: st.column_config.NumberColumn(format="%.1f")
+        for col in ['Taxa (%)', 'Percentil', 'Percentil na GRE'] if col in table_df.columns
+    }
+
     # Determinar a coluna para ordenação
     sort_col = None
 
     # Tentar usar Taxa (%) para ordenação se existir
     if 'Taxa (%)' in table_df.columns:
         sort_col = 'Taxa (%)'
-        table_df['Taxa (%)'] = table_df['Taxa (%)'].round(1)
     # Tentar usar Matriculados ou Inscritos se existirem
     elif 'Matriculados' in table_df.columns:
         sort_col = 'Matriculados'
@@ -121,12 +132,73 @@ def display_data_table(table_df, column_name, display_option):
     if sort_col:
         # Ordenação descendente para números, ascendente para texto
         ascending = not (sort_col in ['Taxa (%)', 'Matriculados', 'Inscritos'])
-        table_df = table_df.sort_values(sort_col, ascending=ascending)
+        # Dados já ordenados (como os da visão do dashboard) não são copiados de novo
+        ja_ordenado = (
+            table_df[sort_col].is_monotonic_increasing if ascending
+            else table_df[sort_col].is_monotonic_decreasing
+        )
+        if not ja_ordenado:
+            table_df = table_df.sort_values(sort_col, ascending=ascending)
 
     # Exibir tabela
     st.dataframe(
         table_df,
         hide_index=True,
         use_container_width=True,
-        height=min(400, 100 + len(table_df) * 35)
-    )
\ No newline at end of file
+        height=min(400, 100 + len(table_df) * 35),
+        column_config=column_config
+    )
+
+def display_ranking(dataset, view, filtro_gre="Todas", filtro_cidade="Todas"):
+    """
+    Exibe o gráfico de ranking de uma janela de entidades (melhores, piores ou em
+    torno de uma busca), com controles de página. Só a janela visível do ranking
+    já calculado vai para o gráfico: o custo depende do tamanho da página.
+    """
+    ranked_df, column_name, display_option = view.grouped_df, view.column_name, view.display_option
+    total = len(ranked_df)
+    if total == 0:
+        st.warning(f"Não há dados disponíveis para o ranking de {display_option}.")
+        return
+
+    entidade = display_option.rstrip('s').lower()
+    controles = st.columns([3, 3, 2, 2])
+    with controles[0]:
+        modo = st.radio("Mostrar:", ["Melhores", "Piores", "Buscar"], horizontal=True)
+    with controles[3]:
+        k = st.selectbox("Itens por página:", [10, RANKING_PAGE_SIZE, 50], index=1)
+
+    if modo == "Buscar":
+        # Janela centrada na entidade encontrada mais bem colocada
+        with controles[1]:
+            busca = st.text_input(f"Buscar {entidade}:", placeholder="Parte do nome")
+        posicoes = search_ranking(ranked_df, column_name, busca) if busca else []
+        if len(posicoes):
+            inicio, fim = ranking_window_around(total, posicoes[0], k)
+            st.caption(
+                f"{len(posicoes):,} resultado(s) para \"{busca}\"; exibindo "
+                f"{ranked_df[column_name].iat[posicoes[0]]} "
+                f"({ranked_df['RANK'].iat[posicoes[0]]}º lugar) e seus vizinhos no ranking."
+            )
+        else:
+            inicio, fim = ranking_window(total, k)
+            if busca:
+                st.caption(f"Nenhum resultado para \"{busca}\".")
+    else:
+        # Páginas contadas a partir do topo (melhores) ou da base (piores) do ranking
+        paginas = ranking_pages(total, k)
+        pagina = 1
+        if paginas > 1:
+            with controles[2]:
+                pagina = st.number_input(f"Página (de {paginas}):", min_value=1, max_value=paginas, value=1)
+        inicio, fim = ranking_window(total, k, pagina, do_fim=modo == "Piores")
+
+    st.caption(f"Posições {inicio + 1} a {fim} de {total:,}")
+
+    # Figura da janela serializada em cache (ver data_loader.get_figure)
+    janela = ranked_df.iloc[inicio:fim]
+    ranking_fig = CachedFigure(get_figure(
+        dataset, ("ranking", inicio, fim), lambda: create_ranking_chart(janela, column_name, display_option),
+        filtro_gre, filtro_cidade, display_option
+    ))
+    st.plotly_chart(ranking_fig, use_container_width=True)
@@ -0,0 +1,205 @@
+import os
+import threading
+import importlib.util
+import logging
+from collections import OrderedDict
+import pyarrow as pa
+from utils import apply_schema, normalize_selection, prepare_dataframe
+
+logger = logging.getLogger(__name__)
+
+# Motor usado para filtrar e agrupar os dados ("pandas" ou "duckdb")
+DEFAULT_ENGINE = os.environ.get("PRIMEIRA_CHANCE_ENGINE", "pandas")
+
+# DuckDB é opcional: sem ele, o dashboard usa sempre o pandas
+DUCKDB_AVAILABLE = importlib.util.find_spec("duckdb") is not None
+
+# Versões dos dados cuja tabela Arrow o DuckDB mantém em memória (a atual e a anterior,
+# ainda consultada por sessões abertas durante uma atualização)
+ARROW_CACHE_VERSIONS = 2
+
+class PandasEngine:
+    """
+    Motor padrão: filtros pelo índice invertido e agregações a partir do cubo (GRE, CIDADE)
+    """
+    name = "pandas"
+
+    def prepare(self, df, filtro_gre="Todas", filtro_cidade="Todas", display_option="Escolas", cube=None, index=None,
+                versao=None):
+        """
+        Filtra, agrupa e categoriza os dados (ver utils.prepare_dataframe)
+        """
+        return prepare_dataframe(df, filtro_gre, filtro_cidade, display_option, cube=cube, index=index)
+
+    def gre_summary(self, filtered_df):
+        """
+        Taxa média, inscritos, matrículas e número de escolas por GRE
+        """
+        gre_analysis = filtered_df.groupby('GRE', observed=True).agg({
+            'TAXA_EFICIENCIA': 'mean',
+            'INSCRITOS': 'sum',
+            'MATRICULAS': 'sum',
+            'ESCOLA': 'count'
+        }).reset_index()
+        return gre_analysis.rename(columns={'ESCOLA': 'Quantidade'})
+
+class DuckDBEngine:
+    """
+    Motor colunar embutido (DuckDB, no próprio processo): os filtros e agrupamentos
+    são executados em SQL sobre uma tabela Arrow convertida do dataframe, guardada
+    por versão dos dados (as colunas já em Arrow, como as de texto, não são copiadas)
+    """
+    name = "duckdb"
+
+    # Taxa de eficiência e categoria, com as mesmas regras de utils.prepare_dataframe
+    _TAXA = "LEAST(GREATEST(INSCRITOS / MATRICULAS * 100, 0), 100)"
+    _CATEGORIA = (
+        "CASE WHEN TAXA_EFICIENCIA < 50 THEN 'Baixo' "
+        "WHEN TAXA_EFICIENCIA < 85 THEN 'Médio' "
+        "WHEN TAXA_EFICIENCIA >= 85 THEN 'Excelente' ELSE 'N/A' END"
+    )
+
+    def __init__(self):
+        import duckdb
+        self._conexao = duckdb.connect()
+        self._lock = threading.Lock()
+        # Tabela Arrow dos dados publicados de cada versão (os dados publicados não mudam)
+        self._tabelas = OrderedDict()
+
+    def _arrow(self, df, versao=None):
+        """
+        Tabela Arrow do dataframe. Com `versao`, convertida uma única vez por versão
+        dos dados; sem ela (ex.: escolas já filtradas), convertida a cada chamada
+        """
+        if versao is None:
+            return pa.Table.from_pandas(df, preserve_index=False)
+        with self._lock:
+            tabela = self._tabelas.get(versao)
+            if tabela is not None:
+                self._tabelas.move_to_end(versao)
+                return tabela
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        with self._lock:
+            self._tabelas[versao] = tabela
+            while len(self._tabelas) > ARROW_CACHE_VERSIONS:
+                self._tabelas.popitem(last=False)
+        return tabela
+
+    def _query(self, df, sql, parametros=(), versao=None):
+        """
+        Executa `sql` sobre `df` (exposto como a tabela `dados`) e retorna um dataframe
+        """
+        tabela = self._arrow(df, versao)
+        # Cada chamada usa seu próprio cursor: a conexão é compartilhada entre sessões
+        with self._lock:
+            cursor = self._conexao.cursor()
+        try:
+            cursor.register("dados", tabela)
+            return cursor.execute(sql, list(parametros)).df()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _where(filtro_gre, filtro_cidade):
+        condicoes, parametros = [], []
+        for coluna, filtro in (("GRE", filtro_gre), ("CIDADE", filtro_cidade)):
+            valores = normalize_selection(filtro)
+            if valores:
+                condicoes.append(f"{coluna} IN ({', '.join('?' * len(valores))})")
+                parametros.extend(valores)
+        return (" WHERE " + " AND ".join(condicoes) if condicoes else ""), parametros
+
+    def prepare(self, df, filtro_gre="Todas", filtro_cidade="Todas", display_option="Escolas", cube=None, index=None,
+                versao=None):
+        """
+        Mesmo resultado de PandasEngine.prepare, calculado em SQL (o cubo e o índice
+        do pandas não são usados; `versao` identifica os dados para reaproveitar a tabela Arrow)
+        """
+        if display_option != "Escolas":
+            filtro_cidade = "Todas"
+        where, parametros = self._where(filtro_gre, filtro_cidade)
+
+        # Escolas filtradas, na ordem original (o DuckDB preserva a ordem de inserção)
+        if where:
+            filtered_df = apply_schema(self._query(df, f"SELECT * FROM dados{where}", parametros, versao))
+            filtered_df = filtered_df.astype({
+                col: df[col].dtype for col in ('GRE', 'CIDADE', 'CATEGORIA') if col in df.columns
+            })
+        else:
+            filtered_df = df
+
+        if display_option == "Escolas":
+            return filtered_df, filtered_df, 'ESCOLA'
+
+        # Cidades ou GREs: agrupar, calcular a taxa e categorizar em uma única consulta
+        column_name = 'CIDADE' if display_option == "Cidades" else 'GRE'
+        grouped_df = self._query(df, f"""
+            SELECT *, {self._CATEGORIA} AS CATEGORIA FROM (
+                SELECT *, {self._TAXA} AS TAXA_EFICIENCIA FROM (
+                    SELECT {column_name},
+                           SUM(INSCRITOS)::BIGINT AS INSCRITOS,
+                           SUM(MATRICULAS)::BIGINT AS MATRICULAS,
+                           COUNT(ESCOLA)::BIGINT AS ESCOLAS
+                    FROM dados{where}
+                    GROUP BY {column_name}
+                )
+            )
+        """, parametros, versao)
+        # Mesmos tipos e ordem (a das categorias) do resultado do pandas
+        grouped_df = grouped_df.astype({
+            column_name: df[column_name].dtype,
+            'INSCRITOS': df['INSCRITOS'].dtype,
+            'MATRICULAS': df['MATRICULAS'].dtype,
+            'CATEGORIA': str
+        })
+        return filtered_df, grouped_df.sort_values(column_name, ignore_index=True), column_name
+
+    def gre_summary(self, filtered_df):
+        """
+        Taxa média, inscritos, matrículas e número de escolas por GRE, em SQL
+        """
+        gre_analysis = self._query(filtered_df, """
+            SELECT GRE,
+                   AVG(TAXA_EFICIENCIA) AS TAXA_EFICIENCIA,
+                   SUM(INSCRITOS)::BIGINT AS INSCRITOS,
+                   SUM(MATRICULAS)::BIGINT AS MATRICULAS,
+                   COUNT(ESCOLA)::BIGINT AS Quantidade
+            FROM dados
+            GROUP BY GRE
+        """)
+        gre_analysis = gre_analysis.astype({
+            'GRE': filtered_df['GRE'].dtype,
+            'TAXA_EFICIENCIA': filtered_df['TAXA_EFICIENCIA'].dtype,
+            'INSCRITOS': filtered_df['INSCRITOS'].dtype,
+            'MATRICULAS': filtered_df['MATRICULAS'].dtype
+        })
+        return gre_analysis.sort_values('GRE', ignore_index=True)
+
+# Motores disponíveis e instâncias já criadas (uma por processo)
+ENGINES = {
+    "pandas": PandasEngine,
+    "duckdb": DuckDBEngine
+}
+_instancias = {}
+_instancias_lock = threading.Lock()
+
+def available_engines():
+    """
+    Nomes dos motores que podem ser usados neste ambiente
+    """
+    return [nome for nome in ENGINES if nome != "duckdb" or DUCKDB_AVAILABLE]
+
+def get_engine(name=None):
+    """
+    Retorna o motor pedido (ou o configurado em PRIMEIRA_CHANCE_ENGINE);
+    se ele não estiver disponível, usa o pandas
+    """
+    name = name or DEFAULT_ENGINE
+    if name not in available_engines():
+        logger.warning("Motor %s indisponível; usando pandas", name)
+        name = "pandas"
+
+    with _instancias_lock:
+        if name not in _instancias:
+            _instancias[name] = ENGINES[name]()
+        return _instancias[name]
@@ -0,0 +1,90 @@
+import io
+import importlib.util
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pandas as pd
+
+# Linhas escritas por vez: o arquivo é gerado em partes, sem montar o texto inteiro em memória
+CHUNK_ROWS = 50_000
+
+# Limite de linhas de uma planilha XLSX (sem contar o cabeçalho)
+XLSX_MAX_ROWS = 1_048_575
+
+# Escritor XLSX do pandas: xlsxwriter (em requirements.txt) ou, na falta dele, openpyxl
+XLSX_ENGINE = next(
+    (nome for nome in ("xlsxwriter", "openpyxl") if importlib.util.find_spec(nome) is not None),
+    None
+)
+
+def export_frame(df):
+    """
+    Dados no formato de exportação: taxa de eficiência como número decimal
+    com uma casa (só essa coluna é copiada)
+    """
+    return df.assign(TAXA_EFICIENCIA=df['TAXA_EFICIENCIA'].astype(float).round(1))
+
+def _chunks(df, tamanho=CHUNK_ROWS):
+    for inicio in range(0, len(df), tamanho):
+        yield df.iloc[inicio:inicio + tamanho]
+
+def write_csv(df, destino):
+    """
+    Escreve o CSV (UTF-8 com BOM, para abrir corretamente no Excel) em partes
+    """
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    try:
+        df.iloc[:0].to_csv(texto, index=False, decimal='.', sep=',')
+        for parte in _chunks(df):
+            parte.to_csv(texto, index=False, header=False, decimal='.', sep=',')
+        texto.flush()
+    finally:
+        # Não fechar o destino junto com o texto
+        texto.detach()
+
+def write_parquet(df, destino):
+    """
+    Escreve o Parquet com um grupo de linhas por parte
+    """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(destino, schema) as escritor:
+        for parte in _chunks(df):
+            escritor.write_table(pa.Table.from_pandas(parte, schema=schema, preserve_index=False))
+
+def write_xlsx(df, destino):
+    """
+    Escreve a planilha XLSX em partes (o pandas escreve as células coluna a coluna,
+    então o modo de memória constante do xlsxwriter não pode ser usado)
+    """
+    if len(df) > XLSX_MAX_ROWS:
+        raise ValueError(f"XLSX comporta no máximo {XLSX_MAX_ROWS:,} linhas ({len(df):,} selecionadas)")
+
+    with pd.ExcelWriter(destino, engine=XLSX_ENGINE) as escritor:
+        linha = 0
+        for parte in _chunks(df):
+            parte.to_excel(escritor, sheet_name="dados", index=False, header=linha == 0,
+                           startrow=linha + (linha > 0))
+            linha += len(parte)
+        if linha == 0:
+            df.to_excel(escritor, sheet_name="dados", index=False)
+
+# Formatos de exportação: escritor, extensão e tipo MIME
+EXPORT_FORMATS = {
+    "CSV": (write_csv, "csv", "text/csv"),
+    "Parquet": (write_parquet, "parquet", "application/vnd.apache.parquet"),
+    "XLSX": (write_xlsx, "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+}
+
+def available_formats():
+    """
+    Formatos que podem ser gerados neste ambiente
+    """
+    return [nome for nome in EXPORT_FORMATS if nome != "XLSX" or XLSX_ENGINE is not None]
+
+def export_bytes(df, formato):
+    """
+    Gera o arquivo de exportação de `df` no formato pedido
+    """
+    escritor = EXPORT_FORMATS[formato][0]
+    destino = io.BytesIO()
+    escritor(export_frame(df), destino)
+    return destino.getvalue()
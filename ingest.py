@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import argparse
+
+# Garantir que o diretório atual esteja no PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+import pandas as pd
+
+from data_loader import (
+    SHEET_NAME, SNAPSHOT_DIR, clean_data, fetch_sheet, load_periods, parse_csv, publish_snapshot
+)
+
+# Snapshot em formato longo (uma linha por escola e período) gerado com --abas:
+# fica separado do snapshot servido pelo dashboard, que exibe um único período
+PERIODS_DIR = os.path.join(SNAPSHOT_DIR, "periodos")
+
+def read_local_file(path, sheet_name=SHEET_NAME):
+    """
+    Lê um arquivo local (CSV, XLSX ou Parquet) e retorna os dados limpos
+    """
+    if path.lower().endswith(".xlsx"):
+        # Usar a aba do balanço se existir, senão a primeira aba do arquivo
+        with pd.ExcelFile(path) as xls:
+            aba = sheet_name if sheet_name in xls.sheet_names else xls.sheet_names[0]
+            bruto = pd.read_excel(xls, sheet_name=aba)
+    elif path.lower().endswith(".parquet"):
+        bruto = pd.read_parquet(path)
+    else:
+        with open(path, "rb") as f:
+            bruto = parse_csv(f.read())
+
+    return clean_data(bruto)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Gera o snapshot pronto para servir (dados limpos e agregados) do dashboard"
+    )
+    parser.add_argument(
+        "--arquivo",
+        help="CSV, XLSX ou Parquet local a ser usado no lugar da planilha do Google Sheets"
+    )
+    parser.add_argument(
+        "--aba",
+        default=SHEET_NAME,
+        help=f"Aba da planilha a ser lida (padrão: {SHEET_NAME})"
+    )
+    parser.add_argument(
+        "--abas",
+        nargs="+",
+        help="Várias abas (períodos) da planilha, baixadas em paralelo e gravadas "
+             "em formato longo com a coluna PERIODO"
+    )
+    parser.add_argument(
+        "--saida",
+        help=f"Diretório dos snapshots (padrão: {SNAPSHOT_DIR}; com --abas, {PERIODS_DIR})"
+    )
+    args = parser.parse_args(argv)
+    if args.abas and args.arquivo:
+        parser.error("--abas lê as abas da planilha do Google Sheets e não pode ser usado com --arquivo")
+
+    saida = args.saida or (PERIODS_DIR if args.abas else SNAPSHOT_DIR)
+
+    inicio = time.perf_counter()
+    if args.abas:
+        df = load_periods(args.abas)
+    elif args.arquivo:
+        df = read_local_file(args.arquivo, args.aba)
+    else:
+        df = fetch_sheet(args.aba)
+
+    versao = publish_snapshot(df, saida)
+    print(f"Versão {versao} publicada em {saida}: {len(df)} registros em {time.perf_counter() - inicio:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,142 @@
+import html
+from string import Template
 import streamlit as st
-from utils import prepare_dataframe
+from utils import prepare_dataframe, CATEGORY_COLORS, TOP_K
 
-def display_metric_cards(filtered_df, column_name):
+def compile_template(fragmento):
     """
-    Exibe os cartões de métricas principais
+    Compila um trecho de HTML em um Template, uma única vez (na importação do
+    módulo). As linhas são unidas em uma só, sem recuo: vários trechos concatenados
+    formam um só bloco HTML, que o markdown não confunde com código.
     """
-    metric_cols = st.columns(4)
-
-    # Total de inscritos
-    with metric_cols[0]:
-        total_inscritos = int(filtered_df['INSCRITOS'].sum())
-        total_matriculas = int(filtered_df['MATRICULAS'].sum())
-        taxa_global = (total_inscritos / total_matriculas * 100) if total_matriculas > 0 else 0
-
-        st.markdown("""
-        <div class="stat-card">
-            <div class="stat-label">Total de Inscritos</div>
-            <div class="stat-value">{:,}</div>
-            <div class="stat-trend">
-                <span>Taxa global: <b>{:.1f}%</b></span>
-            </div>
+    return Template(" ".join(linha.strip() for linha in fragmento.splitlines() if linha.strip()))
+
+def _nome(entity_name, column_name):
+    """
+    Nome exibido da entidade, escapado para HTML (GREs ganham o prefixo "GRE")
+    """
+    if column_name == 'GRE':
+        entity_name = f"GRE {entity_name}"
+    return html.escape(str(entity_name))
+
+# Cartões de métricas: os quatro em uma grade, em um único bloco
+_METRIC_CARD = compile_template("""
+    <div class="stat-card">
+        <div class="stat-label">$rotulo</div>
+        <div class="stat-value">$valor</div>
+        <div class="stat-trend$classe">
+            <span>$detalhe</span>
         </div>
-        """.format(total_inscritos, taxa_global), unsafe_allow_html=True)
-
-    # Total de escolas/cidades/GREs analisadas
-    with metric_cols[1]:
-        display_option = column_name.upper() + 'S' if column_name != 'GRE' else 'GREs'
-        total_entidades = len(filtered_df[column_name].unique())
-
-        st.markdown("""
-        <div class="stat-card">
-            <div class="stat-label">Total de {}</div>
-            <div class="stat-value">{:,}</div>
-            <div class="stat-trend">
-                <span>Em análise</span>
-            </div>
+    </div>
+""")
+_METRIC_GRID = compile_template("""
+    <div class="stat-grid">$cartoes</div>
+""")
+
+# Cartão com título (melhores desempenhos e atenção prioritária)
+_CARD = compile_template("""
+    <div class="card">
+        <div class="card-header">$titulo</div>
+        $conteudo
+    </div>
+""")
+
+_TOP_PERFORMER = compile_template("""
+    <div style='display: flex; align-items: center; margin-bottom: 10px; padding: 8px; background-color: $fundo; border-radius: 4px;'>
+        <div style='width: 25px; height: 25px; background-color: $medalha; color: white; border-radius: 50%; display: flex; justify-content: center; align-items: center; font-weight: 600; margin-right: 10px;'>
+            $posicao
         </div>
-        """.format(display_option, total_entidades), unsafe_allow_html=True)
-
-    # Distribuição de categorias
-    with metric_cols[2]:
-        excelentes = len(filtered_df[filtered_df['CATEGORIA'] == 'Excelente'])
-        pct_excelentes = (excelentes / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
-
-        st.markdown("""
-        <div class="stat-card">
-            <div class="stat-label">Desempenho Excelente</div>
-            <div class="stat-value">{:,}</div>
-            <div class="stat-trend trend-up">
-                <span>{:.1f}% do total</span>
+        <div style='flex-grow: 1;'>
+            <div style='font-weight: 600; font-size: 0.9rem;'>$nome</div>
+            <div style='font-size: 0.8rem; color: #6B7280;'>
+                $inscritos inscritos de $matriculas matriculados
             </div>
         </div>
-        """.format(excelentes, pct_excelentes), unsafe_allow_html=True)
-
-    # Melhores desempenhos
-    with metric_cols[3]:
-        taxa_max = filtered_df['TAXA_EFICIENCIA'].max()
-        melhor_entidade_idx = filtered_df['TAXA_EFICIENCIA'].idxmax()
-        melhor_entidade = filtered_df.loc[melhor_entidade_idx, column_name]
-
-        if len(melhor_entidade) > 20:
-            melhor_entidade = melhor_entidade[:18] + "..."
-
-        st.markdown("""
-        <div class="stat-card">
-            <div class="stat-label">Melhor Desempenho</div>
-            <div class="stat-value">{:.1f}%</div>
-            <div class="stat-trend">
-                <span><b>{}</b></span>
+        <div style='font-weight: 700; font-size: 1.1rem; color: #36B37E; text-align: right;'>
+            $taxa%
+        </div>
+    </div>
+""")
+
+# Cores das posições no ranking: ouro, prata, bronze e as demais
+_MEDALHAS = ["gold", "silver", "#CD7F32"]
+
+_PRIORITY = compile_template("""
+    <div style='margin-bottom: 12px; padding: 10px; background-color: #FFF5F5; border-left: 3px solid #FF5630; border-radius: 4px;'>
+        <div style='font-weight: 600; font-size: 0.9rem;'>$nome</div>
+        <div style='display: flex; justify-content: space-between; margin-top: 5px;'>
+            <div style='font-size: 0.8rem;'>
+                <span style='color: #6B7280;'>Taxa atual:</span>
+                <span style='font-weight: 600; color: #FF5630;'>$taxa%</span>
             </div>
+            <div style='font-size: 0.8rem;'>
+                <span style='color: #6B7280;'>Matriculados:</span>
+                <span style='font-weight: 600;'>$matriculas</span>
+            </div>
+        </div>
+        <div style='font-size: 0.8rem; margin-top: 5px;'>
+            <span style='color: #6B7280;'>Potencial de melhoria:</span>
+            <span style='font-weight: 600; color: #FFAB00;'>+$potencial inscritos</span>
+        </div>
+    </div>
+""")
+
+_NO_PRIORITY = compile_template("""
+    <div style='font-size: 0.9rem; color: #6B7280;'>$mensagem</div>
+""")
+
+# Distribuição por categoria: uma barra por categoria, em um único bloco
+_CATEGORY_ROW = compile_template("""
+    <div style='margin-bottom: 20px;'>
+        <div style='font-size: 16px; font-weight: 600; color: $cor;'>
+            $categoria ($quantidade)
+        </div>
+        <div style='background-color: #F3F4F6; height: 8px; border-radius: 4px; margin: 8px 0;'>
+            <div style='width: $percentual%; height: 8px; background-color: $cor; border-radius: 4px;'></div>
+        </div>
+        <div style='font-size: 14px; color: #4B5563;'>
+            $percentual_texto% dos $entidades
         </div>
-        """.format(taxa_max, melhor_entidade), unsafe_allow_html=True)
+    </div>
+""")
+_CATEGORY_BREAKDOWN = compile_template("""
+    <div style='padding: 20px 0;'>$linhas</div>
+""")
+
+def display_metric_cards(view):
+    """
+    Exibe os cartões de métricas principais (totais já calculados em `view`)
+    """
+    column_name = view.column_name
+    display_option = column_name.upper() + 'S' if column_name != 'GRE' else 'GREs'
+
+    melhor_entidade = view.melhor_entidade
+    if len(melhor_entidade) > 20:
+        melhor_entidade = melhor_entidade[:18] + "..."
+
+    cartoes = [
+        # Total de inscritos
+        _METRIC_CARD.substitute(
+            rotulo="Total de Inscritos", valor=f"{view.total_inscritos:,}", classe="",
+            detalhe=f"Taxa global: <b>{view.taxa_global:.1f}%</b>"
+        ),
+        # Total de escolas/cidades/GREs analisadas
+        _METRIC_CARD.substitute(
+            rotulo=f"Total de {display_option}", valor=f"{view.total_entidades:,}", classe="",
+            detalhe="Em análise"
+        ),
+        # Distribuição de categorias
+        _METRIC_CARD.substitute(
+            rotulo="Desempenho Excelente", valor=f"{view.excelentes:,}", classe=" trend-up",
+            detalhe=f"{view.pct_excelentes:.1f}% do total"
+        ),
+        # Melhores desempenhos
+        _METRIC_CARD.substitute(
+            rotulo="Melhor Desempenho", valor=f"{view.taxa_max:.1f}%", classe="",
+            detalhe=f"<b>{html.escape(melhor_entidade)}</b>"
+        )
+    ]
+    st.markdown(_METRIC_GRID.substitute(cartoes="".join(cartoes)), unsafe_allow_html=True)
 
 def display_summary_card(filtered_df):
     """
@@ -126,128 +192,84 @@ def display_summary_card(filtered_df):
         st.metric("Mediana", f"{taxa_mediana:.1f}%")
         st.metric("Máxima", f"{filtered_df['TAXA_EFICIENCIA'].max():.1f}%")
 
-def display_top_performers(filtered_df, column_name):
+def display_top_performers(view):
     """
     Exibe a lista das entidades com melhor desempenho,
-    agora usando dados corretamente agrupados para cada visualização
+    a partir dos dados agrupados de cada visualização
     """
-    # Se estamos visualizando por Escolas, usar filtered_df diretamente
-    if column_name == 'ESCOLA':
-        display_df = filtered_df.copy()
-    else:
-        # Para Cidades ou GREs, reagrupar os dados
-        display_df = filtered_df.groupby(column_name).agg({
-            'INSCRITOS': 'sum',
-            'MATRICULAS': 'sum'
-        }).reset_index()
-
-        # Recalcular taxa de eficiência para o grupo
-        display_df['TAXA_EFICIENCIA'] = (display_df['INSCRITOS'] / display_df['MATRICULAS'] * 100).clip(0, 100)
-
-    # Selecionar top 5
-    top_entities = display_df.nlargest(5, 'TAXA_EFICIENCIA')
-
-    for i, (_, entity) in enumerate(top_entities.iterrows(), 1):
-        entity_name = entity[column_name]
-        taxa = entity['TAXA_EFICIENCIA']
-        inscritos = entity['INSCRITOS']
-        matriculas = entity['MATRICULAS']
-
-        # Garantir que exibimos o nome completo da entidade
-        # Se estamos visualizando por GREs, adicionar "GRE" antes do número
-        if column_name == 'GRE':
-            display_name = f"GRE {entity_name}"
-        else:
-            display_name = entity_name
-
-        # Exibir entidade com estilo de ranking
-        st.markdown(f"""
-        <div style='display: flex; align-items: center; margin-bottom: 10px; padding: 8px; background-color: {"#F9FAFB" if i % 2 == 0 else "white"}; border-radius: 4px;'>
-            <div style='width: 25px; height: 25px; background-color: {"gold" if i == 1 else "silver" if i == 2 else "#CD7F32" if i == 3 else "#0050B3"}; color: white; border-radius: 50%; display: flex; justify-content: center; align-items: center; font-weight: 600; margin-right: 10px;'>
-                {i}
-            </div>
-            <div style='flex-grow: 1;'>
-                <div style='font-weight: 600; font-size: 0.9rem;'>{display_name}</div>
-                <div style='font-size: 0.8rem; color: #6B7280;'>
-                    {inscritos} inscritos de {matriculas} matriculados
-                </div>
-            </div>
-            <div style='font-weight: 700; font-size: 1.1rem; color: #36B37E; text-align: right;'>
-                {taxa:.1f}%
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    column_name = view.column_name
+    top_entities = view.top_performers
 
-def display_priority_attention(filtered_df, column_name):
+    # Uma linha por entidade, com estilo de ranking
+    linhas = [
+        _TOP_PERFORMER.substitute(
+            fundo="#F9FAFB" if i % 2 == 0 else "white",
+            medalha=_MEDALHAS[i - 1] if i <= len(_MEDALHAS) else "#0050B3",
+            posicao=i,
+            nome=_nome(entity_name, column_name),
+            inscritos=inscritos,
+            matriculas=matriculas,
+            taxa=f"{taxa:.1f}"
+        )
+        for i, (entity_name, taxa, inscritos, matriculas) in enumerate(zip(
+            top_entities[column_name], top_entities['TAXA_EFICIENCIA'],
+            top_entities['INSCRITOS'], top_entities['MATRICULAS']
+        ), 1)
+    ]
+    st.markdown(
+        _CARD.substitute(titulo=f"Top {TOP_K} Melhores Desempenhos", conteudo="".join(linhas)),
+        unsafe_allow_html=True
+    )
+
+def display_priority_attention(view):
     """
     Exibe as entidades que precisam de atenção prioritária,
-    agora usando dados corretamente agrupados para cada visualização
+    a partir dos dados agrupados de cada visualização
     """
-    # Se estamos visualizando por Escolas, usar filtered_df diretamente
-    if column_name == 'ESCOLA':
-        display_df = filtered_df.copy()
-    else:
-        # Para Cidades ou GREs, reagrupar os dados
-        display_df = filtered_df.groupby(column_name).agg({
-            'INSCRITOS': 'sum',
-            'MATRICULAS': 'sum'
-        }).reset_index()
-
-        # Recalcular taxa de eficiência para o grupo
-        display_df['TAXA_EFICIENCIA'] = (display_df['INSCRITOS'] / display_df['MATRICULAS'] * 100).clip(0, 100)
-
-        # Adicionar categorias aos dados agrupados
-        conditions = [
-            (display_df['TAXA_EFICIENCIA'] < 50),
-            (display_df['TAXA_EFICIENCIA'] >= 50) & (display_df['TAXA_EFICIENCIA'] < 85),
-            (display_df['TAXA_EFICIENCIA'] >= 85)
-        ]
-        categories = ["Baixo", "Médio", "Excelente"]
-        display_df['CATEGORIA'] = None
-        for i, condition in enumerate(conditions):
-            display_df.loc[condition, 'CATEGORIA'] = categories[i]
-
-    # Filtrar apenas entidades com baixo desempenho, com mais de 50 matriculados
-    low_performers = display_df[
-        (display_df['TAXA_EFICIENCIA'] < 50) &
-        (display_df['MATRICULAS'] > 50)
-    ].nlargest(5, 'MATRICULAS')
-
-    if not low_performers.empty:
-        for _, entity in low_performers.iterrows():
-            entity_name = entity[column_name]
-            taxa = entity['TAXA_EFICIENCIA']
-            matriculas = int(entity['MATRICULAS'])
-
-            # Se estamos visualizando por GREs, adicionar "GRE" antes do número
-            if column_name == 'GRE':
-                display_name = f"GRE {entity_name}"
-            else:
-                display_name = entity_name
-
-            # Potencial de melhoria (diferença até atingir 50%)
-            gap = 50 - taxa
-            potential_increase = int((gap / 100) * matriculas)
-
-            # Exibir entidade com potencial de melhoria
-            st.markdown(f"""
-            <div style='margin-bottom: 12px; padding: 10px; background-color: #FFF5F5; border-left: 3px solid #FF5630; border-radius: 4px;'>
-                <div style='font-weight: 600; font-size: 0.9rem;'>{display_name}</div>
-                <div style='display: flex; justify-content: space-between; margin-top: 5px;'>
-                    <div style='font-size: 0.8rem;'>
-                        <span style='color: #6B7280;'>Taxa atual:</span>
-                        <span style='font-weight: 600; color: #FF5630;'>{taxa:.1f}%</span>
-                    </div>
-                    <div style='font-size: 0.8rem;'>
-                        <span style='color: #6B7280;'>Matriculados:</span>
-                        <span style='font-weight: 600;'>{matriculas}</span>
-                    </div>
-                </div>
-                <div style='font-size: 0.8rem; margin-top: 5px;'>
-                    <span style='color: #6B7280;'>Potencial de melhoria:</span>
-                    <span style='font-weight: 600; color: #FFAB00;'>+{potential_increase} inscritos</span>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("Não há entidades de baixo desempenho com mais de 50 matriculados.")
\ No newline at end of file
+    column_name = view.column_name
+
+    # Entidades com baixo desempenho, com mais de 50 matriculados
+    low_performers = view.low_performers
+
+    linhas = []
+    for entity_name, taxa, matriculas in zip(
+        low_performers[column_name], low_performers['TAXA_EFICIENCIA'], low_performers['MATRICULAS']
+    ):
+        # Potencial de melhoria (diferença até atingir 50%)
+        gap = 50 - taxa
+        potential_increase = int((gap / 100) * int(matriculas))
+
+        linhas.append(_PRIORITY.substitute(
+            nome=_nome(entity_name, column_name),
+            taxa=f"{taxa:.1f}",
+            matriculas=int(matriculas),
+            potencial=potential_increase
+        ))
+
+    if not linhas:
+        linhas.append(_NO_PRIORITY.substitute(
+            mensagem="Não há entidades de baixo desempenho com mais de 50 matriculados."
+        ))
+    st.markdown(_CARD.substitute(titulo="Atenção Prioritária", conteudo="".join(linhas)), unsafe_allow_html=True)
+
+def display_category_breakdown(view):
+    """
+    Exibe a quantidade e o percentual de cada categoria, com uma barra de progresso
+    """
+    entidades = view.display_option.lower()
+    linhas = [
+        _CATEGORY_ROW.substitute(
+            cor=CATEGORY_COLORS[categoria],
+            categoria=categoria,
+            quantidade=int(quantidade),
+            percentual=percentual,
+            percentual_texto=f"{percentual:.1f}",
+            entidades=entidades
+        )
+        for categoria, quantidade, percentual in zip(
+            view.category_counts['Categoria'], view.category_counts['Quantidade'],
+            view.category_counts['Percentual']
+        )
+        if categoria in CATEGORY_COLORS
+    ]
+    st.markdown(_CATEGORY_BREAKDOWN.substitute(linhas="".join(linhas)), unsafe_allow_html=True)
@@ -0,0 +1,78 @@
+import streamlit as st
+from data_loader import get_figure
+from metrics import display_category_breakdown
+from visualizations import CachedFigure, create_efficiency_map, create_category_distribution
+from details import display_data_table, display_ranking
+
+# Seções com widgets próprios são fragmentos: interações com esses widgets reexecutam
+# só a seção, com os argumentos da última execução completa (a visão já calculada).
+# Seções sem widgets não são fragmentos (cada fragmento acrescenta um contêiner à página).
+# Mudanças nos filtros da barra lateral reexecutam a página inteira.
+
+def efficiency_map_section(dataset, view, filtro_gre="Todas", filtro_cidade="Todas"):
+    """
+    Mapa de eficiência de conversão (quadrantes)
+    """
+    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+    st.subheader("Mapa de Eficiência de Conversão")
+
+    # Figura serializada em cache por versão e filtros
+    efficiency_fig = CachedFigure(get_figure(
+        dataset, "mapa", lambda: create_efficiency_map(view.grouped_df, view.column_name),
+        filtro_gre, filtro_cidade, view.display_option
+    ))
+    st.plotly_chart(efficiency_fig, use_container_width=True)
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+@st.fragment
+def ranking_section(dataset, view, filtro_gre="Todas", filtro_cidade="Todas"):
+    """
+    Ranking de eficiência paginado: trocar de página, de modo ou buscar
+    reexecuta apenas esta seção
+    """
+    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+    st.subheader(f"Ranking de Eficiência - {view.display_option}")
+
+    # Uma página do ranking por vez
+    display_ranking(dataset, view, filtro_gre, filtro_cidade)
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def category_section(dataset, view, filtro_gre="Todas", filtro_cidade="Todas"):
+    """
+    Distribuição por categoria de desempenho (gráfico e resumo)
+    """
+    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+    st.subheader("Distribuição por Categoria de Desempenho")
+
+    # Criar gráfico de distribuição (as contagens já estão na visão)
+    pie_fig = CachedFigure(get_figure(
+        dataset, "categorias", lambda: create_category_distribution(view)[0],
+        filtro_gre, filtro_cidade, view.display_option
+    ))
+
+    # Criar um layout de duas colunas para o gráfico e estatísticas
+    dist_cols = st.columns([3, 2])
+
+    with dist_cols[0]:
+        # Exibir gráfico de pizza
+        st.plotly_chart(pie_fig, use_container_width=True)
+
+    with dist_cols[1]:
+        # Quantidade e percentual de cada categoria, em um único bloco HTML
+        display_category_breakdown(view)
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def data_table_section(view):
+    """
+    Tabela com os dados completos da visualização
+    """
+    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+    st.subheader(f"Dados Completos - {view.display_option}")
+
+    # Exibir tabela de dados
+    display_data_table(view.grouped_df, view.column_name, view.display_option)
+
+    st.markdown('</div>', unsafe_allow_html=True)
@@ -1,10 +1,15 @@
 import streamlit as st
+from data_loader import get_export
+from exports import EXPORT_FORMATS, XLSX_MAX_ROWS, available_formats
 
-def create_sidebar(df):
+def create_sidebar(dataset):
     """
     Cria a barra lateral com filtros e opções
     Retorna os valores de filtro selecionados
     """
+    # Opções dos filtros já calculadas para a versão dos dados (ver utils.FilterOptions)
+    options = dataset.filter_options
+
     with st.sidebar:
         st.markdown('<div class="filter-container">', unsafe_allow_html=True)
         st.markdown('<div class="filter-title">Configuração do Dashboard</div>', unsafe_allow_html=True)
@@ -17,41 +22,61 @@ def create_sidebar(df):
             help="Escolha como deseja visualizar os dados"
         )
 
-        # Filtro de GRE
-        all_gres = sorted(df['GRE'].unique().tolist())
-        filtro_gre = st.selectbox(
+        # Filtro de GRE, com o número de escolas de cada uma; vazio = todas
+        escolas_por_gre = options.escolas_por_gre
+        filtro_gre = st.multiselect(
             "Filtrar por GRE:",
-            ["Todas"] + all_gres,
-            help="Selecione uma GRE específica ou 'Todas'"
+            options.gres,
+            format_func=lambda gre: f"{gre} ({escolas_por_gre[gre]:,} escolas)",
+            placeholder="Todas",
+            help="Selecione uma ou mais GREs (deixe vazio para ver todas)"
         )
 
-        # Aplicar filtro de GRE para o filtro condicional de cidades
-        temp_df = df.copy()
-        if filtro_gre != "Todas":
-            temp_df = temp_df[temp_df['GRE'] == filtro_gre]
-
-        # Filtro condicional para cidades
-        filtro_cidade = "Todas"
+        # Filtro condicional para cidades: apenas as das GREs selecionadas
+        filtro_cidade = []
         if display_option == "Escolas":
-            cidades_disponiveis = sorted(temp_df['CIDADE'].unique().tolist())
-            filtro_cidade = st.selectbox(
+            cidades_disponiveis = options.cities_for(filtro_gre)
+            filtro_cidade = st.multiselect(
                 "Filtrar por Cidade:",
-                ["Todas"] + cidades_disponiveis,
-                help="Selecione uma cidade específica ou 'Todas'"
+                list(cidades_disponiveis),
+                format_func=lambda cidade: f"{cidade} ({cidades_disponiveis[cidade]:,} escolas)",
+                placeholder="Todas",
+                help="Selecione uma ou mais cidades (deixe vazio para ver todas)"
             )
 
-        # Preparar o dataframe para download - corrigindo a formatação da taxa de eficiência
-        download_df = df.copy()
-        # Garantir que TAXA_EFICIENCIA seja um número decimal normal
-        download_df['TAXA_EFICIENCIA'] = download_df['TAXA_EFICIENCIA'].astype(float).round(1)
+        # Exportação: o arquivo só é gerado quando o botão é clicado (e fica em cache
+        # por versão, filtros e formato); o clique não reexecuta o dashboard
+        formatos = available_formats()
+        formato = st.selectbox("Formato do download:", formatos, index=0)
+        apenas_filtrados = st.checkbox(
+            "Baixar apenas os dados filtrados",
+            value=False,
+            help="Exporta somente as escolas das GREs e cidades selecionadas"
+        )
+        gres, cidades = (tuple(filtro_gre), tuple(filtro_cidade)) if apenas_filtrados else ((), ())
+
+        # Número de linhas exportadas, pelos metadados dos filtros
+        if cidades:
+            escolas_por_cidade = options.cities_for(gres)
+            linhas = sum(escolas_por_cidade.get(cidade, 0) for cidade in cidades)
+        elif gres:
+            linhas = sum(options.escolas_por_gre[gre] for gre in gres)
+        else:
+            linhas = len(dataset.df)
+        excede_xlsx = formato == "XLSX" and linhas > XLSX_MAX_ROWS
+        if excede_xlsx:
+            st.caption(f"XLSX comporta no máximo {XLSX_MAX_ROWS:,} linhas; use CSV ou Parquet.")
 
-        # Botão de download
+        _, extensao, mime = EXPORT_FORMATS[formato]
+        sufixo = "_filtrados" if apenas_filtrados else ""
         st.download_button(
-            "📥 Baixar Dados como CSV",
-            download_df.to_csv(index=False, encoding='utf-8-sig', decimal='.', sep=',').encode('utf-8-sig'),
-            f"primeira_chance_dados.csv",
-            "text/csv",
-            key='download-csv'
+            f"📥 Baixar Dados como {formato}",
+            lambda: get_export(dataset, formato, gres, cidades),
+            f"primeira_chance_dados{sufixo}.{extensao}",
+            mime,
+            key='download-dados',
+            on_click="ignore",
+            disabled=excede_xlsx
         )
 
         st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,101 @@
+import os
+import sys
+import argparse
+
+# Garantir que o diretório atual esteja no PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+import pandas as pd
+import pytest
+
+from utils import create_sample_data, build_cube, build_filter_index
+from engines import DUCKDB_AVAILABLE, available_engines, get_engine
+
+# Tamanhos (número de escolas) verificados por padrão: rápidos o bastante para rodar a cada mudança
+DEFAULT_SIZES = [150, 10_000]
+
+# Visões do dashboard
+DISPLAY_OPTIONS = ["Escolas", "Cidades", "GREs"]
+
+def check_engine_parity(df, cube, index, motores):
+    """
+    Compara o resultado de cada motor com o do pandas (filtros, agrupamentos e
+    resumo por GRE) e retorna as divergências encontradas
+    """
+    referencia = get_engine("pandas")
+    gre, cidade = next(iter(index['CIDADE']))
+    varias_gres = sorted(index['GRE'])[:3]
+    varias_cidades = sorted({c for g, c in index['CIDADE'] if g in varias_gres})[:4]
+    filtros = [
+        ("Todas", "Todas"), (gre, "Todas"), (gre, cidade), ("Todas", cidade),
+        (varias_gres, "Todas"), (varias_gres, varias_cidades), ([], varias_cidades)
+    ]
+
+    divergencias = []
+    for nome in motores:
+        if nome == "pandas":
+            continue
+        engine = get_engine(nome)
+        casos = []
+        for filtro_gre, filtro_cidade in filtros:
+            for display_option in DISPLAY_OPTIONS:
+                esperado = referencia.prepare(df, filtro_gre, filtro_cidade, display_option, cube=cube, index=index)
+                obtido = engine.prepare(df, filtro_gre, filtro_cidade, display_option)
+                caso = f"{nome} {display_option} GRE={filtro_gre} CIDADE={filtro_cidade}"
+                casos.append((caso, esperado[0], obtido[0]))
+                casos.append((caso + " (agrupado)", esperado[1], obtido[1]))
+        casos.append((f"{nome} resumo por GRE", referencia.gre_summary(df), engine.gre_summary(df)))
+
+        for caso, esperado, obtido in casos:
+            try:
+                pd.testing.assert_frame_equal(
+                    esperado.reset_index(drop=True), obtido.reset_index(drop=True),
+                    check_exact=False, rtol=1e-5
+                )
+            except AssertionError as e:
+                divergencias.append(f"{caso}: {str(e).splitlines()[0]}")
+
+    return divergencias
+
+def run_parity(tamanhos=DEFAULT_SIZES, seed=42, motores=None):
+    """
+    Verifica a paridade dos motores em dados de exemplo de cada tamanho
+    """
+    motores = motores or available_engines()
+    divergencias = []
+    for n_escolas in tamanhos:
+        df = create_sample_data(n_escolas, n_cidades=min(185, max(16, n_escolas // 5)), seed=seed)
+        divergencias.extend(check_engine_parity(df, build_cube(df), build_filter_index(df), motores))
+    return divergencias
+
+@pytest.mark.skipif(not DUCKDB_AVAILABLE, reason="duckdb não instalado: apenas o motor pandas, nada a comparar")
+def test_engine_parity():
+    assert run_parity() == []
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica se os motores de consulta retornam os mesmos dados")
+    parser.add_argument(
+        "--tamanhos", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="Números de escolas a verificar (padrão: 150 10000)"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Semente dos dados de exemplo")
+    parser.add_argument(
+        "--motores", nargs="+", default=available_engines(),
+        help="Motores de consulta a comparar (padrão: todos os disponíveis)"
+    )
+    args = parser.parse_args(argv)
+
+    if len(args.motores) < 2:
+        print(f"Apenas {', '.join(args.motores)} disponível: nada a comparar")
+
+    divergencias = run_parity(args.tamanhos, args.seed, args.motores)
+    for divergencia in divergencias:
+        print(f"Motores divergentes: {divergencia}")
+    if divergencias:
+        sys.exit(1)
+    print(f"Motores {', '.join(args.motores)} com os mesmos resultados")
+
+if __name__ == "__main__":
+    main()
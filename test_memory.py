@@ -0,0 +1,133 @@
+import os
+import sys
+import argparse
+import logging
+import tracemalloc
+
+# Garantir que o diretório atual esteja no PYTHONPATH
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+import pyarrow as pa
+
+from utils import create_sample_data, prepare_dataframe, build_cube, build_filter_index, build_view_model
+from details import display_data_table
+
+# Fora do `streamlit run` os comandos st.* não desenham nada; silenciar o aviso repetido
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+# Tamanho (número de escolas) a partir do qual o limite vale: nos menores os custos
+# fixos dominam e a razão não é significativa
+LARGE_SIZE = 100_000
+
+# Tamanhos verificados por padrão: rápidos o bastante para rodar a cada mudança
+DEFAULT_SIZES = [LARGE_SIZE]
+
+# Pico de memória aceito por execução, em múltiplos do tamanho dos dados publicados.
+# Na visão de escolas (cerca de 4.3x): a cópia ordenada, com ranking e percentis gerais
+# e por GRE, guardada na visão (1.35x) e a serialização da tabela para o navegador, com
+# o buffer Arrow do Streamlit e a cópia em bytes dele (cerca de 1.4x cada). Os filtros
+# e seleções não copiam os dados.
+DEFAULT_MEMORY_LIMIT = 5.0
+
+# Visões do dashboard
+DISPLAY_OPTIONS = ["Escolas", "Cidades", "GREs"]
+
+# Pools de medição do pyarrow: os buffers alocados por eles (ex.: a coluna ESCOLA
+# ordenada de uma visão guardada) guardam uma referência sem dono ao pool, que
+# por isso não pode ser liberado antes deles
+_arrow_pools = []
+
+def measure_peak(func):
+    """
+    Executa `func` e retorna o pico de memória alocada (bytes) durante a execução:
+    o do Python e do numpy (tracemalloc) somado ao do pyarrow, que o tracemalloc não
+    vê (colunas de texto, conversão da tabela). Os dois picos podem não ser
+    simultâneos: a soma é uma cota superior.
+    """
+    anterior = pa.default_memory_pool()
+    pool = pa.proxy_memory_pool(anterior)
+    _arrow_pools.append(pool)
+    pa.set_memory_pool(pool)
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] + pool.max_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(anterior)
+
+def measure_rerun_memory(n_escolas, seed):
+    """
+    Mede o pico de memória do processamento de uma execução do dashboard
+    (filtros, visão e tabela) em cada visualização, em relação ao tamanho dos dados
+    """
+    df = create_sample_data(n_escolas, n_cidades=min(185, max(16, n_escolas // 5)), seed=seed)
+    # Estruturas calculadas uma única vez por versão (ver data_loader.Dataset)
+    cube, index, nomes_unicos = build_cube(df), build_filter_index(df), bool(df['ESCOLA'].is_unique)
+    tamanho = int(df.memory_usage(deep=True).sum())
+
+    def _rerun(display_option):
+        filtered_df, grouped_df, column_name = prepare_dataframe(
+            df, "Todas", "Todas", display_option, cube=cube, index=index
+        )
+        view = build_view_model(
+            filtered_df, grouped_df, column_name, display_option,
+            nomes_unicos=column_name == 'ESCOLA' and nomes_unicos
+        )
+        display_data_table(view.grouped_df, view.column_name, display_option)
+
+    resultados = []
+    for display_option in DISPLAY_OPTIONS:
+        pico = measure_peak(lambda: _rerun(display_option))
+        resultados.append({
+            "tamanho": n_escolas,
+            "visao": display_option,
+            "pico_bytes": pico,
+            "razao": pico / tamanho
+        })
+        print(f"{n_escolas:>10,} memoria.{display_option.lower():<38} {pico / 2**20:>10.1f} MiB ({pico / tamanho:.2f}x os dados)")
+    return resultados
+
+def check_memory(memoria, limite=DEFAULT_MEMORY_LIMIT):
+    """
+    Retorna as medições (nos tamanhos grandes) com pico acima do limite
+    """
+    return [m for m in memoria if m["tamanho"] >= LARGE_SIZE and m["razao"] > limite]
+
+def run_memory(tamanhos=DEFAULT_SIZES, seed=42, limite=DEFAULT_MEMORY_LIMIT):
+    """
+    Mede o pico de memória por execução em dados de exemplo de cada tamanho
+    e retorna os excessos
+    """
+    memoria = []
+    for n_escolas in tamanhos:
+        memoria.extend(measure_rerun_memory(n_escolas, seed))
+    return check_memory(memoria, limite)
+
+def test_rerun_memory():
+    assert run_memory() == []
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica o pico de memória de uma execução do dashboard")
+    parser.add_argument(
+        "--tamanhos", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="Números de escolas a verificar (padrão: 100000)"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Semente dos dados de exemplo")
+    parser.add_argument(
+        "--limite-memoria", type=float, default=DEFAULT_MEMORY_LIMIT,
+        help="Pico de memória máximo por execução, em múltiplos do tamanho dos dados (padrão: 5.0)"
+    )
+    args = parser.parse_args(argv)
+
+    excessos = run_memory(args.tamanhos, args.seed, args.limite_memoria)
+    for m in excessos:
+        print(f"Pico de memória acima do limite: {m['tamanho']:,} escolas, {m['visao']} ({m['razao']:.2f}x os dados)")
+    if excessos:
+        sys.exit(1)
+    print("Pico de memória dentro do limite")
+
+if __name__ == "__main__":
+    main()
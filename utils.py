@@ -1,5 +1,12 @@
 import pandas as pd
 import numpy as np
+from dataclasses import dataclass
+
+# Dados publicados são somente leitura: com copy-on-write, filtros e seleções
+# compartilham a memória do dataframe original e só copiam as colunas alteradas
+# (comportamento padrão a partir do pandas 3)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # Constantes globais
 CATEGORY_COLORS = {
@@ -8,53 +15,110 @@ CATEGORY_COLORS = {
     "Baixo": "#FF5630"
 }
 
+# Ordem das categorias de eficiência (da menor para a maior taxa)
+CATEGORY_ORDER = ["Baixo", "Médio", "Excelente"]
+
+# Ordem de exibição das categorias (da maior para a menor taxa)
+CATEGORY_DISPLAY_ORDER = ["Excelente", "Médio", "Baixo"]
+
+# Quantidade de entidades nas listas de melhores desempenhos e de atenção prioritária
+TOP_K = 5
+
+# Entidades por página no gráfico de ranking
+RANKING_PAGE_SIZE = 20
+
+# Esquema dos dados limpos: tipos compactos para reduzir a memória por processo
+DATA_SCHEMA = {
+    'GRE': 'category',
+    'CIDADE': 'category',
+    'ESCOLA': str,
+    'INSCRITOS': 'int32',
+    'MATRICULAS': 'int32',
+    'TAXA_EFICIENCIA': 'float32',
+    'CATEGORIA': pd.CategoricalDtype(CATEGORY_ORDER),
+    'PERIODO': 'category'
+}
+
+def apply_schema(df):
+    """
+    Converte as colunas existentes para os tipos do esquema de dados
+    """
+    return df.astype({col: dtype for col, dtype in DATA_SCHEMA.items() if col in df.columns})
+
+# Lista de cidades usada nos dados de exemplo
+SAMPLE_CITIES = [
+    "Recife", "Olinda", "Jaboatão", "Paulista", "Caruaru", "Petrolina",
+    "Garanhuns", "Vitória", "Cabo", "Serra Talhada", "Salgueiro",
+    "Araripina", "Goiana", "Bezerros", "Gravatá", "Carpina"
+]
+
+# Distribuição padrão das categorias nos dados de exemplo
+SAMPLE_CATEGORY_MIX = {"Baixo": 0.3, "Médio": 0.45, "Excelente": 0.25}
+
+# Faixa de taxa (início, largura) sorteada para cada categoria
+_SAMPLE_RATE_RANGES = {"Baixo": (10, 40), "Médio": (50, 35), "Excelente": (85, 15)}
+
 # Função para criar dados de exemplo
-def create_sample_data():
+def create_sample_data(n_escolas=150, n_gres=16, n_cidades=16, category_mix=None, seed=None):
     """
-    Cria dados fictícios mais robustos para quando não for possível acessar a fonte real
+    Cria dados fictícios com o formato da planilha real, de forma vetorizada
+    (de 150 a milhões de escolas em segundos). Com `seed`, os dados são reproduzíveis.
     """
-    # Criar dados fictícios para GREs
-    gres = [f"{i}" for i in range(1, 17)]  # GREs de 1 a 16
+    rng = np.random.default_rng(seed)
+    category_mix = category_mix or SAMPLE_CATEGORY_MIX
 
-    # Lista de cidades
-    cidades = [
-        "Recife", "Olinda", "Jaboatão", "Paulista", "Caruaru", "Petrolina",
-        "Garanhuns", "Vitória", "Cabo", "Serra Talhada", "Salgueiro",
-        "Araripina", "Goiana", "Bezerros", "Gravatá", "Carpina"
-    ]
+    # GREs de 1 a n_gres; cada cidade pertence a uma única GRE
+    gres = [f"{i}" for i in range(1, n_gres + 1)]
+    cidades = SAMPLE_CITIES[:n_cidades] + [f"Cidade {i}" for i in range(len(SAMPLE_CITIES) + 1, n_cidades + 1)]
+    gre_da_cidade = rng.permutation(np.arange(n_cidades) % n_gres)
+
+    cidade_idx = rng.integers(0, n_cidades, n_escolas)
+    matriculas = rng.integers(30, 300, n_escolas)
 
-    # Criar dados de 150 escolas
-    data = []
-    for i in range(1, 151):
-        gre = np.random.choice(gres)
-        cidade = np.random.choice(cidades)
-        escola = f"Escola Estadual {i}"
-        matriculas = np.random.randint(30, 300)
-
-        # Distribuição de categorias (excelente: 25%, médio: 45%, baixo: 30%)
-        categoria = np.random.choice([1, 2, 3], p=[0.3, 0.45, 0.25])
-
-        if categoria == 3:  # Excelente (>= 85%)
-            taxa = 85 + np.random.random() * 15
-            inscritos = int(matriculas * (taxa / 100))
-        elif categoria == 2:  # Médio (50-85%)
-            taxa = 50 + np.random.random() * 35
-            inscritos = int(matriculas * (taxa / 100))
-        else:  # Baixo (< 50%)
-            taxa = 10 + np.random.random() * 40
-            inscritos = int(matriculas * (taxa / 100))
-
-        data.append({
-            'GRE': gre,
-            'CIDADE': cidade,
-            'ESCOLA': escola,
-            'MATRICULAS': matriculas,
-            'INSCRITOS': inscritos,
-            'TAXA_EFICIENCIA': taxa,
-            'CATEGORIA': "Excelente" if categoria == 3 else "Médio" if categoria == 2 else "Baixo"
-        })
-
-    return pd.DataFrame(data)
+    # Sortear a categoria e uma taxa dentro da faixa correspondente
+    nomes = list(category_mix)
+    pesos = np.array([category_mix[nome] for nome in nomes], dtype=float)
+    categoria_idx = rng.choice(len(nomes), size=n_escolas, p=pesos / pesos.sum())
+    inicio = np.array([_SAMPLE_RATE_RANGES[nome][0] for nome in nomes])[categoria_idx]
+    largura = np.array([_SAMPLE_RATE_RANGES[nome][1] for nome in nomes])[categoria_idx]
+    taxa = inicio + rng.random(n_escolas) * largura
+
+    df = pd.DataFrame({
+        'GRE': pd.Categorical.from_codes(gre_da_cidade[cidade_idx], categories=gres),
+        'CIDADE': pd.Categorical.from_codes(cidade_idx, categories=cidades),
+        'ESCOLA': "Escola Estadual " + pd.Series(np.arange(1, n_escolas + 1)).astype(str),
+        'MATRICULAS': matriculas,
+        'INSCRITOS': (matriculas * (taxa / 100)).astype(int),
+        'TAXA_EFICIENCIA': taxa,
+        'CATEGORIA': pd.Categorical.from_codes(categoria_idx, categories=nomes)
+    })
+
+    return apply_schema(df)
+
+def sample_sheet(df):
+    """
+    Dados limpos de volta às colunas da planilha original
+    """
+    return df[['GRE', 'CIDADE', 'ESCOLA', 'INSCRITOS', 'MATRICULAS']].rename(
+        columns={'MATRICULAS': 'MATRÍCULAS DE 3ª SÉRIE'}
+    )
+
+def write_sample_fixture(path, df=None, **kwargs):
+    """
+    Grava dados de exemplo (`df`, ou gerados com `kwargs`) com as colunas da planilha
+    original, em CSV ou Parquet conforme a extensão, para alimentar a ingestão
+    (ver ingest.read_local_file) em testes e medições
+    """
+    if df is None:
+        df = create_sample_data(**kwargs)
+    sheet = sample_sheet(df)
+
+    if path.lower().endswith(".parquet"):
+        sheet.to_parquet(path, index=False)
+    else:
+        sheet.to_csv(path, index=False)
+
+    return path
 
 # Função para calcular categoria de eficiência
 def calculate_efficiency_category(taxa):
@@ -68,49 +132,434 @@ def calculate_efficiency_category(taxa):
     else:
         return "Baixo"
 
+# Função para pré-agregar os dados por GRE e cidade
+def build_cube(df, chaves=('GRE', 'CIDADE')):
+    """
+    Agrega inscritos, matrículas e número de escolas por (GRE, CIDADE), ou pelas `chaves` indicadas
+    """
+    return df.groupby(list(chaves), observed=True).agg(
+        INSCRITOS=('INSCRITOS', 'sum'),
+        MATRICULAS=('MATRICULAS', 'sum'),
+        ESCOLAS=('ESCOLA', 'count')
+    ).reset_index()
+
+def _pair_codes(df, pares):
+    """
+    Código inteiro de cada par (GRE, CIDADE) das linhas de `df` e dos pares indicados,
+    a partir dos códigos das colunas categóricas (pares ausentes em `df` ficam de fora)
+    """
+    gres, cidades = df['GRE'].cat.categories, df['CIDADE'].cat.categories
+    codigos_gre = gres.get_indexer([gre for gre, _ in pares])
+    codigos_cidade = cidades.get_indexer([cidade for _, cidade in pares])
+    presentes = (codigos_gre >= 0) & (codigos_cidade >= 0)
+
+    linhas = df['GRE'].cat.codes.to_numpy().astype(np.int64) * len(cidades) + df['CIDADE'].cat.codes.to_numpy()
+    return linhas, codigos_gre[presentes].astype(np.int64) * len(cidades) + codigos_cidade[presentes]
+
+def update_cube(cube, df, pares):
+    """
+    Atualiza o cubo recalculando apenas os pares (GRE, CIDADE) alterados; as escolas
+    desses pares são encontradas pelos códigos das categorias, sem montar chaves de texto
+    """
+    pares = list(pares)
+    linhas_cubo, alterados_cubo = _pair_codes(cube, pares)
+    linhas, alterados = _pair_codes(df, pares)
+
+    mantidos = cube[~np.isin(linhas_cubo, alterados_cubo)]
+    recalculados = build_cube(df[np.isin(linhas, alterados)])
+    atualizado = pd.concat([mantidos, recalculados], ignore_index=True)
+    atualizado = atualizado.astype({'GRE': 'category', 'CIDADE': 'category'})
+    return atualizado.sort_values(['GRE', 'CIDADE'], ignore_index=True)
+
+def rollup_cube(cube, column_name):
+    """
+    Consolida o cubo por GRE ou por cidade e calcula a taxa de eficiência
+    """
+    grouped_df = cube.groupby(column_name, observed=True).agg({
+        'INSCRITOS': 'sum',
+        'MATRICULAS': 'sum',
+        'ESCOLAS': 'sum'
+    }).reset_index()
+    grouped_df['TAXA_EFICIENCIA'] = (grouped_df['INSCRITOS'] / grouped_df['MATRICULAS'] * 100).clip(0, 100)
+    return grouped_df
+
+def build_filter_index(df):
+    """
+    Índice invertido dos filtros: posições das linhas de cada GRE e de cada
+    par (GRE, CIDADE), em ordem crescente
+    """
+    return {
+        'GRE': df.groupby('GRE', observed=True).indices,
+        'CIDADE': df.groupby(['GRE', 'CIDADE'], observed=True).indices
+    }
+
+def normalize_selection(filtro):
+    """
+    Valores selecionados em um filtro, em ordem e sem repetição.
+    Aceita "Todas", um único valor ou uma lista; vazio significa todos.
+    """
+    if filtro is None or isinstance(filtro, str):
+        filtro = () if filtro in (None, "Todas") else (filtro,)
+    return tuple(sorted({valor for valor in filtro if valor != "Todas"}))
+
+def _union_positions(partes):
+    """
+    Une listas de posições disjuntas e ordenadas (uma por valor selecionado)
+    """
+    if not partes:
+        return np.empty(0, dtype=np.intp)
+    if len(partes) == 1:
+        return partes[0]
+    return np.sort(np.concatenate(partes))
+
+def filter_positions(index, filtro_gre="Todas", filtro_cidade="Todas"):
+    """
+    Posições das linhas que atendem aos filtros (None quando não há filtro).
+    Cada filtro pode ter vários valores (OU entre eles); GRE e cidade são
+    combinados (E) pelas posições já calculadas de cada par (GRE, CIDADE),
+    de modo que o custo depende das linhas selecionadas, não do total.
+    """
+    gres = normalize_selection(filtro_gre)
+    cidades = frozenset(normalize_selection(filtro_cidade))
+
+    if cidades:
+        # A mesma cidade pode aparecer em mais de uma GRE
+        if gres:
+            pares = [(gre, cidade) for gre in gres for cidade in sorted(cidades)]
+        else:
+            pares = [par for par in index['CIDADE'] if par[1] in cidades]
+        return _union_positions([index['CIDADE'][par] for par in pares if par in index['CIDADE']])
+
+    if gres:
+        return _union_positions([index['GRE'][gre] for gre in gres if gre in index['GRE']])
+
+    return None
+
+def filter_dataframe(df, index, filtro_gre="Todas", filtro_cidade="Todas"):
+    """
+    Aplica os filtros de GRE e cidade com uma leitura posicional pelo índice,
+    sem percorrer o dataframe inteiro
+    """
+    posicoes = filter_positions(index, filtro_gre, filtro_cidade)
+    if posicoes is None:
+        return df
+    return df.take(posicoes)
+
+@dataclass(frozen=True)
+class FilterOptions:
+    """
+    Opções dos filtros da barra lateral (GREs, cidades e número de escolas
+    de cada opção), calculadas uma única vez por versão dos dados
+    """
+    gres: tuple
+    escolas_por_gre: dict
+    # Cidades de cada GRE, em ordem, com o número de escolas do par (GRE, CIDADE)
+    cidades_por_gre: dict
+    # Todas as cidades, somando as escolas de todas as GREs
+    cidades: dict
+
+    def cities_for(self, filtro_gre=()):
+        """
+        Cidades disponíveis (em ordem, com o número de escolas) para as GREs selecionadas
+        """
+        gres = normalize_selection(filtro_gre)
+        if not gres:
+            return self.cidades
+        if len(gres) == 1:
+            return self.cidades_por_gre.get(gres[0], {})
+
+        cidades = {}
+        for gre in gres:
+            for cidade, escolas in self.cidades_por_gre.get(gre, {}).items():
+                cidades[cidade] = cidades.get(cidade, 0) + escolas
+        return dict(sorted(cidades.items()))
+
+def build_filter_options(index):
+    """
+    Opções dos filtros a partir do índice invertido (ver build_filter_index),
+    sem percorrer o dataframe
+    """
+    gres = tuple(sorted(index['GRE']))
+    escolas_por_gre = {gre: len(index['GRE'][gre]) for gre in gres}
+
+    # Pares (GRE, CIDADE) em ordem: as cidades de cada GRE já saem ordenadas
+    cidades_por_gre = {gre: {} for gre in gres}
+    cidades = {}
+    for (gre, cidade), posicoes in sorted(index['CIDADE'].items()):
+        cidades_por_gre[gre][cidade] = len(posicoes)
+        cidades[cidade] = cidades.get(cidade, 0) + len(posicoes)
+
+    return FilterOptions(
+        gres=gres,
+        escolas_por_gre=escolas_por_gre,
+        cidades_por_gre=cidades_por_gre,
+        cidades=dict(sorted(cidades.items()))
+    )
+
 # Função para preparar dataframe para visualização
-def prepare_dataframe(df, filtro_gre="Todas", filtro_cidade="Todas", display_option="Escolas"):
+def prepare_dataframe(df, filtro_gre="Todas", filtro_cidade="Todas", display_option="Escolas", cube=None, index=None):
     """
     Prepara e filtra o dataframe conforme os filtros selecionados
+    (cada filtro aceita "Todas", um valor ou uma lista de valores).
+    Com `cube` (ver build_cube), as visões de cidades e GREs são consolidadas
+    a partir do cubo em vez de agrupar todas as escolas; com `index`
+    (ver build_filter_index), os filtros são aplicados por posição.
     """
-    # Aplicar filtro de GRE
-    filtered_df = df.copy()
-    if filtro_gre != "Todas":
-        filtered_df = filtered_df[filtered_df['GRE'] == filtro_gre]
+    # Filtro de cidade só se aplica à visão de escolas
+    if display_option != "Escolas":
+        filtro_cidade = "Todas"
+    gres = normalize_selection(filtro_gre)
+    cidades = normalize_selection(filtro_cidade)
 
-    # Aplicar filtro de cidade
-    if display_option == "Escolas" and filtro_cidade != "Todas":
-        filtered_df = filtered_df[filtered_df['CIDADE'] == filtro_cidade]
+    # Aplicar filtros de GRE e cidade (um ou mais valores em cada)
+    if index is not None:
+        filtered_df = filter_dataframe(df, index, gres, cidades)
+    else:
+        filtered_df = df
+        if gres:
+            filtered_df = filtered_df[filtered_df['GRE'].isin(gres)]
+        if cidades:
+            filtered_df = filtered_df[filtered_df['CIDADE'].isin(cidades)]
 
     # Preparar dados agrupados conforme visualização selecionada
     if display_option == "Escolas":
-        # Para escolas, usamos os dados já filtrados
-        grouped_df = filtered_df.copy()
+        # Para escolas, usamos os próprios dados filtrados (já categorizados)
+        grouped_df = filtered_df
         column_name = 'ESCOLA'
-    elif display_option == "Cidades":
-        # Agrupar por cidade
-        grouped_df = filtered_df.groupby('CIDADE').agg({
-            'INSCRITOS': 'sum',
-            'MATRICULAS': 'sum'
-        }).reset_index()
-        grouped_df['TAXA_EFICIENCIA'] = (grouped_df['INSCRITOS'] / grouped_df['MATRICULAS'] * 100).clip(0, 100)
-        column_name = 'CIDADE'
-    else:  # GREs
-        # Agrupar por GRE
-        grouped_df = filtered_df.groupby('GRE').agg({
-            'INSCRITOS': 'sum',
-            'MATRICULAS': 'sum'
-        }).reset_index()
-        grouped_df['TAXA_EFICIENCIA'] = (grouped_df['INSCRITOS'] / grouped_df['MATRICULAS'] * 100).clip(0, 100)
-        column_name = 'GRE'
-
-    # Adicionar categorias aos dados agrupados
-    conditions = [
-        (grouped_df['TAXA_EFICIENCIA'] < 50),
-        (grouped_df['TAXA_EFICIENCIA'] >= 50) & (grouped_df['TAXA_EFICIENCIA'] < 85),
-        (grouped_df['TAXA_EFICIENCIA'] >= 85)
+    else:
+        # Cidades ou GREs: consolidar o cubo (GRE, CIDADE)
+        column_name = 'CIDADE' if display_option == "Cidades" else 'GRE'
+        if cube is None:
+            cube = build_cube(filtered_df)
+        elif gres:
+            cube = cube[cube['GRE'].isin(gres)]
+        grouped_df = rollup_cube(cube, column_name)
+
+        # Adicionar categorias aos dados agrupados
+        conditions = [
+            (grouped_df['TAXA_EFICIENCIA'] < 50),
+            (grouped_df['TAXA_EFICIENCIA'] >= 50) & (grouped_df['TAXA_EFICIENCIA'] < 85),
+            (grouped_df['TAXA_EFICIENCIA'] >= 85)
+        ]
+        categories = ["Baixo", "Médio", "Excelente"]
+        grouped_df['CATEGORIA'] = np.select(conditions, categories, default="N/A")
+
+    return filtered_df, grouped_df, column_name
+
+def select_top_k(values, k, largest=True):
+    """
+    Posições dos k maiores (ou menores) valores, em ordem, por seleção parcial
+    (sem ordenar todos os valores); empates ficam na ordem original
+    """
+    chave = -np.asarray(values, dtype=np.float64) if largest else np.asarray(values, dtype=np.float64)
+    if k <= 0 or len(chave) == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(chave):
+        # Candidatos: valores até o k-ésimo, incluindo todos os empates com ele
+        limite = np.partition(chave, k - 1)[k - 1]
+        candidatos = np.flatnonzero(chave <= limite)
+    else:
+        candidatos = np.arange(len(chave))
+    return candidatos[np.lexsort((candidatos, chave[candidatos]))][:k]
+
+def _dense_ranks(valores, inicios):
+    """
+    Ranking denso e percentil de valores já ordenados (decrescente dentro de cada grupo,
+    com os grupos começando nas posições `inicios`). O percentil é a porcentagem
+    de entidades do grupo com taxa menor ou igual.
+    """
+    n = len(valores)
+    inicios = np.asarray(inicios, dtype=np.int32)
+    tamanhos = np.diff(np.r_[inicios, n]).astype(np.int32)
+
+    # Início de cada bloco de valores iguais
+    novo_valor = np.ones(n, dtype=bool)
+    novo_valor[1:] = valores[1:] != valores[:-1]
+    novo_valor[inicios] = True
+
+    # Ranking denso: blocos de valores distintos desde o início do grupo
+    contagem = np.cumsum(novo_valor, dtype=np.int32)
+    rank = contagem - np.repeat(contagem[inicios] - 1, tamanhos)
+    del contagem
+
+    # Percentil: entidades do grupo com taxa maior ficam de fora
+    blocos = np.flatnonzero(novo_valor).astype(np.int32)
+    maiores = np.repeat(blocos, np.diff(np.r_[blocos, n])) - np.repeat(inicios, tamanhos)
+    tamanho_grupo = np.repeat(tamanhos, tamanhos).astype(np.float32)
+    percentil = (tamanho_grupo - maiores) / tamanho_grupo * np.float32(100)
+    return rank, percentil.astype(np.float32, copy=False)
+
+def rank_entities(grouped_df, column_name):
+    """
+    Ordena as entidades pela taxa de eficiência (decrescente, empates na ordem original)
+    uma única vez e acrescenta o ranking denso e o percentil (RANK, PERCENTIL) e,
+    na visão de escolas, os mesmos dentro de cada GRE (RANK_GRE, PERCENTIL_GRE)
+    """
+    taxas = grouped_df['TAXA_EFICIENCIA'].to_numpy()
+    ordem = np.argsort(-taxas, kind='stable')
+    # Posição no ranking como índice (RangeIndex, sem guardar os rótulos originais)
+    ranked = grouped_df.take(ordem).reset_index(drop=True)
+    taxas = taxas[ordem]
+    del ordem
+    if len(ranked) == 0:
+        return ranked.assign(RANK=np.int32(0), PERCENTIL=np.float32(0))
+
+    # Ranking geral
+    rank, percentil = _dense_ranks(taxas, [0])
+    colunas = {'RANK': rank, 'PERCENTIL': percentil}
+
+    # Ranking dentro da GRE: reordenar (de forma estável) por GRE, mantendo a taxa decrescente
+    if 'GRE' in ranked.columns and column_name != 'GRE':
+        gres = ranked['GRE'].astype('category').cat.codes.to_numpy()
+        por_gre = np.argsort(gres, kind='stable')
+        gres = gres[por_gre]
+        inicios = np.flatnonzero(np.r_[True, gres[1:] != gres[:-1]])
+        rank_gre, percentil_gre = _dense_ranks(taxas[por_gre], inicios)
+        colunas['RANK_GRE'] = np.empty_like(rank_gre)
+        colunas['PERCENTIL_GRE'] = np.empty_like(percentil_gre)
+        colunas['RANK_GRE'][por_gre] = rank_gre
+        colunas['PERCENTIL_GRE'][por_gre] = percentil_gre
+
+    return ranked.assign(**colunas)
+
+@dataclass(frozen=True)
+class DashboardView:
+    """
+    Tudo o que uma execução do dashboard exibe, calculado uma única vez
+    a partir dos dados filtrados e agrupados
+    """
+    filtered_df: pd.DataFrame
+    # Dados agrupados, ordenados pela taxa de eficiência (decrescente),
+    # com ranking e percentil (ver rank_entities)
+    grouped_df: pd.DataFrame
+    column_name: str
+    display_option: str
+    total_inscritos: int
+    total_matriculas: int
+    taxa_global: float
+    total_entidades: int
+    excelentes: int
+    pct_excelentes: float
+    # Maior taxa entre as escolas filtradas e a entidade a que ela pertence
+    taxa_max: float
+    melhor_entidade: str
+    top_performers: pd.DataFrame
+    low_performers: pd.DataFrame
+    # Quantidade e percentual de escolas por categoria, na ordem de exibição
+    category_counts: pd.DataFrame
+
+def count_categories(filtered_df):
+    """
+    Conta as escolas de cada categoria, com o percentual sobre o total
+    """
+    category_counts = filtered_df['CATEGORIA'].value_counts().reset_index()
+    category_counts.columns = ['Categoria', 'Quantidade']
+    category_counts = category_counts[category_counts['Quantidade'] > 0]
+
+    # Adicionar percentuais
+    total = category_counts['Quantidade'].sum()
+    category_counts['Percentual'] = category_counts['Quantidade'] / total * 100
+
+    # Garantir que as categorias estejam na ordem correta
+    category_counts['Categoria'] = pd.Categorical(
+        category_counts['Categoria'].astype(str),
+        categories=CATEGORY_DISPLAY_ORDER,
+        ordered=True
+    )
+    return category_counts.sort_values('Categoria', ignore_index=True)
+
+def build_view_model(filtered_df, grouped_df, column_name, display_option, nomes_unicos=False):
+    """
+    Calcula totais, listas e contagens usados pelos cartões, listas e gráficos.
+    `nomes_unicos` indica que nenhuma escola dos dados completos repete o nome.
+    """
+    # Entidades de baixo desempenho com mais de 50 matriculados (empates na ordem original)
+    candidatos = grouped_df[
+        (grouped_df['TAXA_EFICIENCIA'] < 50) &
+        (grouped_df['MATRICULAS'] > 50)
     ]
-    categories = ["Baixo", "Médio", "Excelente"]
-    grouped_df['CATEGORIA'] = np.select(conditions, categories, default="N/A")
+    low_performers = candidatos.take(select_top_k(candidatos['MATRICULAS'], TOP_K))
+
+    # Ordem do ranking calculada uma única vez e reaproveitada por listas, gráficos e tabela
+    grouped_df = rank_entities(grouped_df, column_name)
+
+    # Totais (os agrupados somam o mesmo que as escolas filtradas)
+    total_inscritos = int(grouped_df['INSCRITOS'].sum())
+    total_matriculas = int(grouped_df['MATRICULAS'].sum())
+    taxa_global = (total_inscritos / total_matriculas * 100) if total_matriculas > 0 else 0
+    if column_name == 'ESCOLA':
+        # Nomes únicos na versão: cada linha é uma escola distinta, sem a tabela de
+        # hash de nunique (mais de duas vezes o tamanho da coluna ESCOLA no pyarrow)
+        total_entidades = len(filtered_df) if nomes_unicos else filtered_df['ESCOLA'].nunique()
+    else:
+        total_entidades = len(grouped_df)
+
+    # Categorias das escolas filtradas
+    category_counts = count_categories(filtered_df)
+    excelentes = int(category_counts.loc[category_counts['Categoria'] == 'Excelente', 'Quantidade'].sum())
+    pct_excelentes = (excelentes / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
 
-    return filtered_df, grouped_df, column_name
\ No newline at end of file
+    # Escola de maior taxa
+    taxa_max, melhor_entidade = 0.0, ""
+    if len(filtered_df) > 0:
+        melhor_idx = filtered_df['TAXA_EFICIENCIA'].idxmax()
+        taxa_max = float(filtered_df.at[melhor_idx, 'TAXA_EFICIENCIA'])
+        melhor_entidade = str(filtered_df.at[melhor_idx, column_name])
+
+    # Melhores desempenhos
+    top_performers = grouped_df.head(TOP_K)
+
+    return DashboardView(
+        filtered_df=filtered_df,
+        grouped_df=grouped_df,
+        column_name=column_name,
+        display_option=display_option,
+        total_inscritos=total_inscritos,
+        total_matriculas=total_matriculas,
+        taxa_global=taxa_global,
+        total_entidades=total_entidades,
+        excelentes=excelentes,
+        pct_excelentes=pct_excelentes,
+        taxa_max=taxa_max,
+        melhor_entidade=melhor_entidade,
+        top_performers=top_performers,
+        low_performers=low_performers,
+        category_counts=category_counts
+    )
+
+def ranking_window(total, k=RANKING_PAGE_SIZE, pagina=1, do_fim=False):
+    """
+    Intervalo [início, fim) da página `pagina` (a partir de 1) de um ranking com
+    `total` entidades, contando do topo ou, com `do_fim`, da base do ranking
+    """
+    pagina = min(max(pagina, 1), ranking_pages(total, k))
+    if do_fim:
+        fim = total - (pagina - 1) * k
+        return max(fim - k, 0), fim
+    inicio = (pagina - 1) * k
+    return inicio, min(inicio + k, total)
+
+def ranking_pages(total, k=RANKING_PAGE_SIZE):
+    """
+    Número de páginas de um ranking com `total` entidades (ao menos uma)
+    """
+    return max(-(-total // k), 1)
+
+def ranking_window_around(total, posicao, k=RANKING_PAGE_SIZE):
+    """
+    Intervalo [início, fim) de `k` entidades centrado na posição `posicao` do ranking
+    """
+    inicio = min(max(posicao - k // 2, 0), max(total - k, 0))
+    return inicio, min(inicio + k, total)
+
+def search_ranking(ranked_df, column_name, busca):
+    """
+    Posições (no ranking) das entidades cujo nome contém `busca`, sem diferenciar
+    maiúsculas; em colunas categóricas, a busca é feita só nas categorias
+    """
+    coluna = ranked_df[column_name]
+    if isinstance(coluna.dtype, pd.CategoricalDtype):
+        nomes = coluna.cat.categories.to_series()
+        encontradas = np.flatnonzero(nomes.str.contains(busca, case=False, regex=False).to_numpy())
+        return np.flatnonzero(np.isin(coluna.cat.codes.to_numpy(), encontradas))
+    return np.flatnonzero(coluna.str.contains(busca, case=False, regex=False).to_numpy(dtype=bool))
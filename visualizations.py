@@ -1,45 +1,182 @@
+import json
 import streamlit as st
-import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from utils import CATEGORY_COLORS
+from utils import CATEGORY_COLORS, CATEGORY_DISPLAY_ORDER, TOP_K, select_top_k
+from engines import get_engine
 
-def create_efficiency_map(plot_data, column_name):
+class CachedFigure(go.Figure):
     """
-    Cria o mapa de eficiência (gráfico de dispersão com quadrantes)
+    Figura já serializada (ver data_loader.get_figure), entregue ao st.plotly_chart
+    sem ser reconstruída nem validada de novo
     """
-    # Criar o gráfico de dispersão com quadrantes
-    fig = px.scatter(
-        plot_data,
-        x='MATRICULAS',
-        y='TAXA_EFICIENCIA',
-        color='CATEGORIA',
-        color_discrete_map=CATEGORY_COLORS,
-        size=[12] * len(plot_data),
-        size_max=15,
-        hover_name=column_name,
-        hover_data={
-            'MATRICULAS': True,
-            'INSCRITOS': True,
-            'TAXA_EFICIENCIA': ':.1f',
-            'CATEGORIA': False
-        },
-        labels={
-            'MATRICULAS': 'Total de Matriculados',
-            'TAXA_EFICIENCIA': 'Taxa de Eficiência (%)',
-            'CATEGORIA': 'Categoria'
-        },
-        height=500
+
+    def __init__(self, figura_json):
+        figura = json.loads(figura_json)
+        # Só a altura e a largura são lidas da figura pelo Streamlit; o resto vem do JSON
+        layout = figura.get('layout', {})
+        super().__init__(layout={k: layout[k] for k in ('height', 'width') if k in layout})
+        self._figura = figura
+
+    def to_dict(self):
+        return self._figura
+
+# Acima deste número de pontos o mapa usa WebGL e rotula apenas os destaques
+WEBGL_THRESHOLD = 1_000
+
+# Acima deste número de pontos o mapa agrupa as entidades em células de densidade
+DENSITY_THRESHOLD = 20_000
+
+# Células de densidade: faixas de matrículas e faixas de 5 pontos de taxa
+# (alinhadas aos limites das categorias, 50% e 85%)
+DENSITY_X_BINS = 60
+DENSITY_Y_STEP = 5
+
+def select_highlights(plot_data, k=TOP_K):
+    """
+    Posições das entidades rotuladas no mapa: as `k` primeiras e as `k` últimas
+    do ranking (dados ordenados pela taxa, como os de rank_entities) e até `k`
+    valores extremos de matrículas (acima de Q3 + 3 x IQR)
+    """
+    n = len(plot_data)
+    posicoes = [np.arange(min(k, n)), np.arange(max(n - k, 0), n)]
+
+    matriculas = plot_data['MATRICULAS'].to_numpy()
+    if n:
+        q1, q3 = np.percentile(matriculas, [25, 75])
+        extremos = np.flatnonzero(matriculas > q3 + 3 * (q3 - q1))
+        posicoes.append(extremos[select_top_k(matriculas[extremos], k)])
+
+    return np.unique(np.concatenate(posicoes))
+
+def _density_cells(plot_data, column_name):
+    """
+    Agrupa as entidades em células (faixa de matrículas x faixa de taxa), com a
+    quantidade, as médias e a melhor entidade de cada célula
+    """
+    matriculas = plot_data['MATRICULAS'].to_numpy(dtype=float)
+    taxas = plot_data['TAXA_EFICIENCIA'].to_numpy(dtype=float)
+
+    bordas = np.linspace(matriculas.min(), matriculas.max(), DENSITY_X_BINS + 1)
+    faixa_x = np.clip(np.searchsorted(bordas, matriculas, side='right') - 1, 0, DENSITY_X_BINS - 1)
+    faixa_y = np.minimum(taxas // DENSITY_Y_STEP, 100 // DENSITY_Y_STEP).astype(np.int64)
+
+    # Os dados estão ordenados pela taxa: a primeira entidade de cada célula é a melhor
+    cells = plot_data.groupby(faixa_x * 1000 + faixa_y, sort=False).agg(
+        QUANTIDADE=('MATRICULAS', 'size'),
+        MATRICULAS=('MATRICULAS', 'mean'),
+        INSCRITOS=('INSCRITOS', 'mean'),
+        TAXA_EFICIENCIA=('TAXA_EFICIENCIA', 'mean'),
+        MELHOR=(column_name, 'first')
     )
 
-    # Adicionar rótulos para os pontos
-    fig.update_traces(
-        textposition='top center',
-        textfont=dict(size=10, color="#333333"),
-        text=plot_data[column_name],
-        marker=dict(line=dict(width=1, color='white'))
+    # Categoria pela faixa de taxa (cada faixa cabe inteira em uma categoria)
+    inicio_faixa = (cells.index.to_numpy() % 1000) * DENSITY_Y_STEP
+    cells['CATEGORIA'] = np.select(
+        [inicio_faixa < 50, inicio_faixa < 85], ['Baixo', 'Médio'], default='Excelente'
     )
+    return cells
+
+def _create_density_map(plot_data, column_name):
+    """
+    Mapa de eficiência com as entidades agrupadas em células de densidade
+    (tamanho proporcional à quantidade; detalhes da célula ao passar o mouse)
+    """
+    cells = _density_cells(plot_data, column_name)
+    tamanho = 6 + 24 * np.sqrt(cells['QUANTIDADE'] / cells['QUANTIDADE'].max())
+
+    fig = go.Figure()
+    for categoria in CATEGORY_DISPLAY_ORDER:
+        selecao = (cells['CATEGORIA'] == categoria).to_numpy()
+        if not selecao.any():
+            continue
+        celulas = cells[selecao]
+        fig.add_trace(go.Scattergl(
+            x=celulas['MATRICULAS'],
+            y=celulas['TAXA_EFICIENCIA'],
+            mode='markers',
+            name=categoria,
+            marker=dict(size=tamanho[selecao], color=CATEGORY_COLORS[categoria],
+                        opacity=0.7, line=dict(width=1, color='white')),
+            customdata=celulas[['QUANTIDADE', 'INSCRITOS', 'MELHOR']],
+            hovertemplate=(
+                "<b>%{customdata[0]:,} entidades</b><br>"
+                "Matrículas (média): %{x:,.0f}<br>"
+                "Inscritos (média): %{customdata[1]:,.0f}<br>"
+                "Taxa média: %{y:.1f}%<br>"
+                "Melhor: %{customdata[2]}<extra></extra>"
+            )
+        ))
+
+    fig.update_layout(
+        height=500,
+        xaxis_title='Total de Matriculados',
+        yaxis_title='Taxa de Eficiência (%)'
+    )
+    return fig
+
+def create_efficiency_map(plot_data, column_name):
+    """
+    Cria o mapa de eficiência (gráfico de dispersão com quadrantes).
+    Com muitos pontos, usa WebGL e rotula só os destaques (ver select_highlights);
+    acima de DENSITY_THRESHOLD, agrupa as entidades em células de densidade.
+    """
+    n = len(plot_data)
+    if n > DENSITY_THRESHOLD:
+        fig = _create_density_map(plot_data, column_name)
+    else:
+        # Criar o gráfico de dispersão com quadrantes
+        fig = px.scatter(
+            plot_data,
+            x='MATRICULAS',
+            y='TAXA_EFICIENCIA',
+            color='CATEGORIA',
+            color_discrete_map=CATEGORY_COLORS,
+            hover_name=column_name,
+            hover_data={
+                'MATRICULAS': True,
+                'INSCRITOS': True,
+                'TAXA_EFICIENCIA': ':.1f',
+                'CATEGORIA': False
+            },
+            labels={
+                'MATRICULAS': 'Total de Matriculados',
+                'TAXA_EFICIENCIA': 'Taxa de Eficiência (%)',
+                'CATEGORIA': 'Categoria'
+            },
+            render_mode='webgl' if n > WEBGL_THRESHOLD else 'svg',
+            height=500
+        )
+        fig.update_traces(marker=dict(size=15, line=dict(width=1, color='white')))
+
+    if n <= WEBGL_THRESHOLD:
+        # Adicionar rótulos para os pontos
+        fig.update_traces(
+            textposition='top center',
+            textfont=dict(size=10, color="#333333"),
+            text=plot_data[column_name]
+        )
+    else:
+        # Muitos pontos: rotular apenas o topo, a base do ranking e os extremos
+        destaques = plot_data.take(select_highlights(plot_data))
+        fig.add_trace(go.Scatter(
+            x=destaques['MATRICULAS'],
+            y=destaques['TAXA_EFICIENCIA'],
+            mode='markers+text',
+            text=destaques[column_name],
+            textposition='top center',
+            textfont=dict(size=10, color="#333333"),
+            marker=dict(size=9, color='rgba(0, 0, 0, 0)', line=dict(width=2, color='#333333')),
+            customdata=destaques[['INSCRITOS']],
+            hovertemplate=(
+                "<b>%{text}</b><br>"
+                "Total de Matriculados: %{x:,}<br>"
+                "Inscritos: %{customdata[0]:,}<br>"
+                "Taxa de Eficiência (%): %{y:.1f}<extra></extra>"
+            ),
+            showlegend=False
+        ))
 
     # Adicionar linhas de referência para os quadrantes
     x_min = plot_data['MATRICULAS'].min() * 0.8
@@ -122,12 +259,14 @@ def create_efficiency_map(plot_data, column_name):
 
 def create_ranking_chart(display_df, column_name, display_option):
     """
-    Cria o gráfico de ranking de eficiência
+    Cria o gráfico de ranking de eficiência a partir dos dados já ordenados
+    pela taxa (decrescente), como os de rank_entities (ou uma janela deles)
     """
+    hover_data = [col for col in ('RANK', 'RANK_GRE', 'INSCRITOS', 'MATRICULAS') if col in display_df.columns]
     if display_option == "Escolas":
         # Para escolas, usamos gráfico horizontal devido ao potencial número de itens
         fig_bar = px.bar(
-            display_df.sort_values('TAXA_EFICIENCIA', ascending=True),  # Removido .tail(num_items)
+            display_df.iloc[::-1],  # Ordem do ranking invertida: maior taxa no topo do eixo
             y=column_name,
             x='TAXA_EFICIENCIA',
             color='CATEGORIA',
@@ -135,11 +274,13 @@ def create_ranking_chart(display_df, column_name, display_option):
             orientation='h',
             labels={
                 column_name: display_option.rstrip('s'),
-                'TAXA_EFICIENCIA': 'Taxa de Eficiência (%)'
+                'TAXA_EFICIENCIA': 'Taxa de Eficiência (%)',
+                'RANK': 'Posição',
+                'RANK_GRE': 'Posição na GRE'
             },
             text='TAXA_EFICIENCIA',
-            height=min(500, 100 + len(display_df) * 25),  # Usar comprimento de display_df em vez de num_items
-            hover_data=['INSCRITOS', 'MATRICULAS']
+            height=100 + len(display_df) * 25,  # Uma página do ranking: altura proporcional ao número de barras
+            hover_data=hover_data
         )
 
         # Formatação dos textos nas barras
@@ -151,18 +292,20 @@ def create_ranking_chart(display_df, column_name, display_option):
 
     else:  # Para Cidades ou GREs, usamos barras verticais
         fig_bar = px.bar(
-            display_df.sort_values('TAXA_EFICIENCIA', ascending=False),
+            display_df,
             x=column_name,
             y='TAXA_EFICIENCIA',
             color='CATEGORIA',
             color_discrete_map=CATEGORY_COLORS,
             labels={
                 column_name: display_option.rstrip('s'),
-                'TAXA_EFICIENCIA': 'Taxa de Eficiência (%)'
+                'TAXA_EFICIENCIA': 'Taxa de Eficiência (%)',
+                'RANK': 'Posição',
+                'RANK_GRE': 'Posição na GRE'
             },
             text='TAXA_EFICIENCIA',
             height=400,
-            hover_data=['INSCRITOS', 'MATRICULAS']
+            hover_data=hover_data
         )
 
         # Formatação para texto nas barras
@@ -191,26 +334,13 @@ def create_ranking_chart(display_df, column_name, display_option):
     )
 
     return fig_bar
-def create_category_distribution(filtered_df):
+def create_category_distribution(view):
     """
     Cria o gráfico de distribuição por categoria
     """
-    # Dados para o gráfico de distribuição
-    category_counts = filtered_df['CATEGORIA'].value_counts().reset_index()
-    category_counts.columns = ['Categoria', 'Quantidade']
-
-    # Adicionar percentuais
-    total = category_counts['Quantidade'].sum()
-    category_counts['Percentual'] = category_counts['Quantidade'] / total * 100
-
-    # Garantir que as categorias estejam na ordem correta
-    category_order = ["Excelente", "Médio", "Baixo"]
-    category_counts['Categoria'] = pd.Categorical(
-        category_counts['Categoria'],
-        categories=category_order,
-        ordered=True
-    )
-    category_counts = category_counts.sort_values('Categoria')
+    # Contagem das categorias já calculada para esta visualização
+    category_counts = view.category_counts
+    category_order = CATEGORY_DISPLAY_ORDER
 
     # Criar gráfico de pizza moderno
     fig_pie = px.pie(
@@ -259,21 +389,14 @@ def create_mini_histogram(filtered_df):
 
     return fig_hist
 
-def create_gre_analysis_chart(filtered_df):
+def create_gre_analysis_chart(filtered_df, engine=None):
     """
-    Cria gráfico de análise por GRE
+    Cria gráfico de análise por GRE (agregação pelo motor configurado, ver engines.py)
     """
     if 'GRE' not in filtered_df.columns:
         return None
 
-    gre_analysis = filtered_df.groupby('GRE').agg({
-        'TAXA_EFICIENCIA': 'mean',
-        'INSCRITOS': 'sum',
-        'MATRICULAS': 'sum',
-        'ESCOLA': 'count'
-    }).reset_index()
-
-    gre_analysis = gre_analysis.rename(columns={'ESCOLA': 'Quantidade'})
+    gre_analysis = (engine or get_engine()).gre_summary(filtered_df)
     gre_analysis['TAXA_EFICIENCIA'] = gre_analysis['TAXA_EFICIENCIA'].round(1)
 
     # Criar um gráfico de barras horizontal com as GREs